@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# Benchmarks for the caption processing in captions.py, run it with: python benchmark_captions.py
+import re
+import time
+import random
+from io import StringIO
+from datetime import datetime, timedelta
+import numpy as np
+import webvtt
+from caption_track import CaptionTrack
+from captions import get_equally_separated_captions, filter_timestamps, iterate_filtered_timestamps, get_timestamps, iterate_vtt_captions, get_milliseconds_from_string
+
+repeat = 3
+
+def get_equally_separated_captions_nested_loop(captions, delta_seconds):
+    """
+    Previous version of get_equally_separated_captions, every spaced caption scans the captions from the start
+    """
+    total_seconds = (captions[-1]['end_time'] - captions[0]['start_time']).total_seconds()
+    timestamps_list = list(np.arange(0, total_seconds, delta_seconds)) + [total_seconds]
+    timestamps_list = [timedelta(seconds = timestamp) for timestamp in timestamps_list]
+    spaced_captions = [{'start_time': timestamps_list[i],
+                        'end_time': timestamps_list[i+1]} for i in range(len(timestamps_list) - 1)]
+    for spaced_caption in spaced_captions:
+        for caption in captions:
+            if (spaced_caption['end_time'] < caption['end_time']):
+                spaced_caption.update({key: caption[key] for key in caption.keys() if key not in ['start_time', 'end_time']})
+                break
+    return spaced_captions
+
+def filter_adjacent_texts_with_pops(timestamps):
+    """
+    Previous version of filter_adjacent_texts, the contained captions are popped from the middle of the list
+    """
+    filtered_timestamps = []
+    for i in range(1, len(timestamps) - 1):
+        if timestamps[i][2] not in timestamps[i-1][2] and timestamps[i][2] not in timestamps[i+1][2]:
+            filtered_timestamps.append(timestamps[i])
+    i = 1
+    while i < len(filtered_timestamps) - 1:
+        if filtered_timestamps[i][2] in filtered_timestamps[i-1][2] + " " + filtered_timestamps[i+1][2]:
+            filtered_timestamps.pop(i)
+        else:
+            i += 1
+    if timestamps[0][2] not in filtered_timestamps[0][2]:
+        filtered_timestamps.insert(0, timestamps[0])
+    filtered_timestamps.append(timestamps[-1])
+    return filtered_timestamps
+
+def filter_timestamps_fixpoint(timestamps, n=10):
+    """
+    Previous version of filter_timestamps, the whole list is filtered again until it does not change
+    """
+    filtered_timestamps = filter_adjacent_texts_with_pops(timestamps)
+    for i in range(n):
+        if filtered_timestamps == timestamps:
+            break
+        timestamps = filtered_timestamps
+        filtered_timestamps = filter_adjacent_texts_with_pops(timestamps)
+    return filtered_timestamps
+
+def get_rolling_captions(count):
+    """
+    Returns count raw captions like the YouTube automatic ones, the two lines of every caption are followed
+    by a short caption with only the second line, which is the first line of the next caption
+    """
+    lines = [f'line {index} with some words' for index in range(count // 2 + 2)]
+    timestamps = []
+    for index in range(count // 2):
+        timestamps.append((index * 2, index * 2 + 1, lines[index] + ' ' + lines[index + 1]))
+        timestamps.append((index * 2 + 1, index * 2 + 2, lines[index + 1]))
+    return timestamps
+
+def get_timedelta_from_string_strptime(string):
+    """
+    Previous version of get_timedelta_from_string
+    """
+    return datetime.strptime(string, '%H:%M:%S.%f') - datetime.strptime('00:00:00.000', '%H:%M:%S.%f')
+
+def get_timestamps_webvtt(vtt_subtitles):
+    """
+    Previous parsing of the captions in get_raw_timestamps and get_timestamps, with webvtt and strptime
+    """
+    timestamps = []
+    for caption in webvtt.read_buffer(StringIO(vtt_subtitles)):
+        caption_text = re.sub(r'\n', ' ', caption.text).strip()
+        timestamps.append((get_timedelta_from_string_strptime(caption.start),
+                           get_timedelta_from_string_strptime(caption.end), caption_text))
+    return timestamps
+
+def get_timestamps_milliseconds(vtt_subtitles):
+    """
+    Parses the captions with iterate_vtt_captions and converts the times to timedelta at the end, like get_captions
+    """
+    return get_timestamps(iterate_vtt_captions(StringIO(vtt_subtitles)))
+
+def get_vtt(count):
+    """
+    Returns a VTT file with count cues like the YouTube automatic captions, with tags for the time of every word
+    """
+    lines = ['WEBVTT', 'Kind: captions', 'Language: en', '']
+    for index in range(count):
+        start = index * 1234
+        start_string = f'{start // 3600000:02d}:{start // 60000 % 60:02d}:{start // 1000 % 60:02d}.{start % 1000:03d}'
+        end = start + 1234
+        end_string = f'{end // 3600000:02d}:{end // 60000 % 60:02d}:{end // 1000 % 60:02d}.{end % 1000:03d}'
+        lines += [f'{start_string} --> {end_string} align:start position:0%',
+                  f'line {index}',
+                  f'line<{end_string}><c> {index + 1}</c>', '']
+    return '\n'.join(lines)
+
+def get_random_captions(count, seed=0):
+    """
+    Returns count captions like the ones of get_captions, with random durations between 0.5 and 5 seconds
+    """
+    rng = random.Random(seed)
+    captions = []
+    start = timedelta(seconds=rng.uniform(0, 2))
+    for index in range(count):
+        end = start + timedelta(milliseconds=rng.randint(500, 5000))
+        captions.append({'start_time': start, 'end_time': end, 'text': f'caption {index}'})
+        start = end
+    return captions
+
+def time_function(function, *args):
+    """
+    Returns the best wall clock time in seconds of running function(*args) repeat times
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_equally_separated_captions():
+    """
+    Compares the nested loop and the binary search versions of get_equally_separated_captions with 0.2 s spaced captions
+    """
+    print('captions  spaced  nested loop (s)  binary search (s)  speedup  same output')
+    for count in [100, 400, 1600]:
+        captions = get_random_captions(count)
+        old = get_equally_separated_captions_nested_loop(captions, 0.2)
+        new = get_equally_separated_captions(captions, 0.2)
+        nested_loop = time_function(get_equally_separated_captions_nested_loop, captions, 0.2)
+        binary_search = time_function(get_equally_separated_captions, captions, 0.2)
+        print(f'{count:8d}  {len(new):6d}  {nested_loop:15.3f}  {binary_search:17.3f}  {nested_loop / binary_search:6.1f}x  {old == new}')
+    # a two hour transcript is too slow for the nested loop
+    captions = get_random_captions(2 * 3600 // 2)
+    print(f'{len(captions)} captions over {captions[-1]["end_time"]}: '
+          f'{time_function(get_equally_separated_captions, captions, 0.2):.3f} s with the binary search, '
+          f'{time_function(CaptionTrack.resample, CaptionTrack.from_captions(captions), 0.2):.3f} s with a CaptionTrack')
+
+def benchmark_filter_timestamps():
+    """
+    Compares the filters with pops until the list does not change, the filters without pops until the list does not change
+    and the chained streaming filters of an iterator on rolling captions
+    """
+    print('captions    kept  fixpoint (s)  no pops (s)  speedup  streaming (s)  speedup  same output')
+    for count in [1000, 10000, 100000, 400000]:
+        timestamps = get_rolling_captions(count)
+        old = filter_timestamps_fixpoint(timestamps)
+        new = filter_timestamps(timestamps)
+        same = old == new == list(iterate_filtered_timestamps(iter(timestamps)))
+        fixpoint = time_function(filter_timestamps_fixpoint, timestamps)
+        no_pops = time_function(filter_timestamps, timestamps)
+        streaming = time_function(lambda: list(iterate_filtered_timestamps(iter(timestamps))))
+        print(f'{count:8d}  {len(new):6d}  {fixpoint:12.3f}  {no_pops:11.3f}  {fixpoint / no_pops:6.1f}x  '
+              f'{streaming:13.3f}  {fixpoint / streaming:6.1f}x  {same}')
+
+def benchmark_timestamps():
+    """
+    Compares parsing the timestamps of a 10k cues VTT file with webvtt and strptime and with iterate_vtt_captions
+    """
+    timestamps = [f'{index // 3600:02d}:{index // 60 % 60:02d}:{index % 60:02d}.{index % 1000:03d}' for index in range(20000)]
+    strptime = time_function(lambda: [get_timedelta_from_string_strptime(timestamp) for timestamp in timestamps])
+    milliseconds = time_function(lambda: [get_milliseconds_from_string(timestamp) for timestamp in timestamps])
+    print(f'{len(timestamps)} timestamps: strptime {strptime * 1000:.1f} ms, '
+          f'milliseconds {milliseconds * 1000:.1f} ms, {strptime / milliseconds:.1f}x')
+    vtt_subtitles = get_vtt(10000)
+    same = get_timestamps_webvtt(vtt_subtitles) == get_timestamps_milliseconds(vtt_subtitles)
+    old = time_function(get_timestamps_webvtt, vtt_subtitles)
+    new = time_function(get_timestamps_milliseconds, vtt_subtitles)
+    print(f'10000 cues: webvtt and strptime {old * 1000:.1f} ms, iterate_vtt_captions {new * 1000:.1f} ms, '
+          f'{old / new:.1f}x, same output {same}')
+
+if __name__ == '__main__':
+    benchmark_equally_separated_captions()
+    benchmark_filter_timestamps()
+    benchmark_timestamps()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Benchmarks for the frame interpolation in rife_interpolate.py, run it with: python benchmark_interpolation.py
+import time
+import torch
+from model.warplayer import backwarp_tenGrid
+from rife_interpolate import generate_frames, interpolate, device, get_model, measure_quality
+
+height, width = 256, 448
+repeat = 3
+
+def generate_frames_with_host_copies(img0, img1, n=1):
+    """
+    Previous version of generate_frames, every midpoint is copied to numpy and back to the device
+    """
+    frames = [img0, img1]
+    for i in range(n):
+        new_frames = []
+        for image0, image1 in zip(frames, frames[1:]):
+            mid = interpolate(image0, image1).cpu().detach().numpy()
+            mid = torch.tensor(mid).to(device)
+            new_frames.append(image0)
+            new_frames.append(mid)
+        new_frames.append(frames[-1])
+        frames = new_frames
+    return frames[1:-1]
+
+def time_function(function, *args):
+    """
+    Returns the best wall clock time in seconds of running function(*args) repeat times
+    """
+    times = []
+    for _ in range(repeat):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        function(*args)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_host_copies():
+    """
+    Compares the time per generated frame with and without the device -> numpy -> device copies for n=1..4
+    """
+    img0 = torch.rand(1, 3, height, width, device=device)
+    img1 = torch.rand(1, 3, height, width, device=device)
+    print(f'generate_frames on {device}, {width}x{height}')
+    print('n  frames  host copies (ms/frame)  on device (ms/frame)  saving')
+    for n in range(1, 5):
+        frames = 2 ** n - 1
+        with_copies = time_function(generate_frames_with_host_copies, img0, img1, n) / frames * 1000
+        on_device = time_function(generate_frames, img0, img1, n) / frames * 1000
+        print(f'{n}  {frames:6d}  {with_copies:22.2f}  {on_device:20.2f}  {1 - on_device / with_copies:6.1%}')
+
+def benchmark_engines():
+    """
+    Compares the frames/s of the training Model with the InferenceModel, eager and traced, on the cpu
+    """
+    img0 = torch.rand(1, 3, height, width)
+    img1 = torch.rand(1, 3, height, width)
+    print(f'interpolate on cpu, {width}x{height}')
+    print('engine                 first call (s)  frames/s')
+    for name, options in [('Model', {}),
+                          ('InferenceModel', {'optimized': True}),
+                          ('InferenceModel trace', {'optimized': True, 'jit': 'trace'})]:
+        model = get_model('cpu', **options)
+        # every engine starts cold, without the warp grids cached by the previous one
+        backwarp_tenGrid.clear()
+        start = time.perf_counter()
+        with torch.no_grad():
+            interpolate(img0, img1, model)
+        first_call = time.perf_counter() - start
+        with torch.no_grad():
+            frames_per_second = 1 / time_function(interpolate, img0, img1, model)
+        print(f'{name:22s} {first_call:15.2f} {frames_per_second:9.2f}')
+
+def benchmark_precisions():
+    """
+    Compares the frames/s and the quality against fp32 of the reduced precision models on the cpu
+    """
+    img0 = torch.rand(1, 3, height, width)
+    img1 = torch.roll(img0, 8, 3)
+    print(f'interpolate on cpu, {width}x{height}')
+    print('precision  frames/s  PSNR (dB)  MS-SSIM')
+    for precision in ['fp32', 'bf16', 'int8']:
+        model = get_model('cpu', precision=precision)
+        psnr, quality = measure_quality(img0, img1, model)
+        with torch.no_grad():
+            frames_per_second = 1 / time_function(interpolate, img0, img1, model)
+        print(f'{precision:9s} {frames_per_second:9.2f} {psnr:10.2f} {quality:8.4f}')
+
+if __name__ == '__main__':
+    benchmark_host_copies()
+    benchmark_engines()
+    benchmark_precisions()
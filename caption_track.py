@@ -0,0 +1,191 @@
+# Description: This file contains an array backed track of captions, with a dict compatible view of every caption
+import sys
+from collections.abc import MutableMapping
+from datetime import timedelta
+import numpy as np
+
+TIME_KEYS = ('start_time', 'end_time')
+
+
+def get_microseconds(times):
+    """
+    Returns a numpy array with the timedelta objects of times in integer microseconds, so they compare exactly like the timedeltas
+    """
+    return np.array([time // timedelta(microseconds=1) for time in times], dtype=np.int64)
+
+
+def get_microseconds_from_seconds(seconds):
+    """
+    Returns a numpy array with the seconds (floats) in integer microseconds, rounded like timedelta(seconds=seconds)
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    whole = np.trunc(seconds)
+    # timedelta rounds only the fractional part, half to even
+    return whole.astype(np.int64) * 10 ** 6 + np.round((seconds - whole) * 1e6).astype(np.int64)
+
+
+def get_field_array(values):
+    """
+    Returns an object array with the values, the strings are interned so repeated texts are stored once
+    """
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = sys.intern(value) if type(value) is str else value
+    return array
+
+
+class CaptionView(MutableMapping):
+    """
+    Dict compatible view of a caption of a CaptionTrack. The times are timedelta objects, the fields set to None are missing keys,
+    and setting a key sets the field of the caption in the track.
+    """
+    def __init__(self, track, index):
+        self.track = track
+        self.index = index
+
+    def __getitem__(self, key):
+        if key in TIME_KEYS:
+            return timedelta(microseconds=int(getattr(self.track, key)[self.index]))
+        value = self.track.fields[key][self.index] if key in self.track.fields else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.track.set_value(key, self.index, value)
+
+    def __delitem__(self, key):
+        if key in TIME_KEYS or key not in self:
+            raise KeyError(key)
+        self.track.fields[key][self.index] = None
+
+    def __iter__(self):
+        yield from TIME_KEYS
+        for key, values in self.track.fields.items():
+            if values[self.index] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CaptionTrack:
+    """
+    Captions stored by columns: the start and end times in numpy arrays of integer microseconds,
+    and every other field (text, description, frame_name...) in an object array with the interned strings, None where it is missing.
+    Indexing with an int returns a CaptionView of the caption, iterating returns the views of all the captions in order,
+    so the track can be used like the lists of dicts returned by captions.get_captions. Indexing with a slice, an array of indexes
+    or a boolean mask returns a new CaptionTrack.
+    """
+    def __init__(self, start_time, end_time, **fields):
+        self.start_time = np.asarray(start_time, dtype=np.int64)
+        self.end_time = np.asarray(end_time, dtype=np.int64)
+        self.fields = {}
+        for key, values in fields.items():
+            self.set_field(key, values)
+
+    @classmethod
+    def from_captions(cls, captions):
+        """
+        Returns a track with the captions in a list of dicts with keys start_time, end_time (timedelta objects) and any other fields
+        """
+        if isinstance(captions, CaptionTrack):
+            return captions
+        captions = list(captions)
+        keys = {}
+        for caption in captions:
+            keys.update(dict.fromkeys(key for key in caption.keys() if key not in TIME_KEYS))
+        return cls(get_microseconds(caption['start_time'] for caption in captions),
+                   get_microseconds(caption['end_time'] for caption in captions),
+                   **{key: [caption.get(key) for caption in captions] for key in keys})
+
+    @classmethod
+    def from_timestamps(cls, timestamps):
+        """
+        Returns a track with the captions in an iterable of tuples with the start time, end time (in milliseconds) and text of each caption
+        """
+        start_time, end_time, text = [], [], []
+        for timestamp in timestamps:
+            start_time.append(timestamp[0])
+            end_time.append(timestamp[1])
+            text.append(timestamp[2])
+        return cls(np.array(start_time, dtype=np.int64) * 1000, np.array(end_time, dtype=np.int64) * 1000, text=text)
+
+    def to_captions(self):
+        """
+        Returns the captions as a list of dicts like the ones of captions.get_captions
+        """
+        return [dict(caption) for caption in self]
+
+    def set_field(self, key, values):
+        """
+        Sets the field key of every caption from a sequence of values, one per caption
+        """
+        if key in TIME_KEYS:
+            setattr(self, key, np.asarray(values, dtype=np.int64))
+            return
+        if len(values) != len(self):
+            raise ValueError(f'{len(values)} values for {len(self)} captions')
+        # the object arrays of other tracks already have interned strings
+        self.fields[key] = values if isinstance(values, np.ndarray) and values.dtype == object else get_field_array(values)
+
+    def set_value(self, key, index, value):
+        """
+        Sets the field key of the caption at index, times are timedelta objects
+        """
+        if key in TIME_KEYS:
+            getattr(self, key)[index] = value // timedelta(microseconds=1)
+            return
+        if key not in self.fields:
+            self.fields[key] = np.full(len(self), None, dtype=object)
+        self.fields[key][index] = sys.intern(value) if type(value) is str else value
+
+    def __len__(self):
+        return len(self.start_time)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CaptionView(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if not -len(self) <= index < len(self):
+                raise IndexError('caption index out of range')
+            return CaptionView(self, index % len(self))
+        # copied, so the new track never shares its arrays with this one like the slices of a list
+        return CaptionTrack(np.array(self.start_time[index]), np.array(self.end_time[index]),
+                            **{key: np.array(values[index]) for key, values in self.fields.items()})
+
+    def __repr__(self):
+        return f'CaptionTrack({len(self)} captions, fields {list(self.fields)})'
+
+    def slice_time(self, start_time, end_time):
+        """
+        Returns a track with the captions that overlap the interval between start_time and end_time (timedelta objects)
+        """
+        start_time = start_time // timedelta(microseconds=1)
+        end_time = end_time // timedelta(microseconds=1)
+        return self[(self.end_time > start_time) & (self.start_time < end_time)]
+
+    def lookup(self, times):
+        """
+        Returns the index of the first caption that ends after each of the times (integer microseconds),
+        or the number of captions when all of them end before.
+        """
+        # the running maximum of the end times is sorted even if the end times are not, so it can be found with a binary search
+        return np.searchsorted(np.maximum.accumulate(self.end_time), times, side='right')
+
+    def resample(self, delta_seconds):
+        """
+        Returns a track of captions equally spaced by delta_seconds from 0, spanning the duration of the track,
+        each with the fields of the first caption that ends after it. It is the same as captions.get_equally_separated_captions.
+        """
+        total_seconds = int(self.end_time[-1] - self.start_time[0]) / 10 ** 6
+        times = get_microseconds_from_seconds(np.append(np.arange(0, total_seconds, delta_seconds), total_seconds))
+        indexes = self.lookup(times[1:])
+        # the spaced captions after the last end time get the missing fields of the extra None
+        return CaptionTrack(times[:-1], times[1:],
+                            **{key: np.append(values, None)[indexes] for key, values in self.fields.items()})
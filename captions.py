@@ -1,84 +1,203 @@
 #!/usr/bin/env python3
 # Description: Extract captions from YouTube videos using the yt-dlp library.
 import os, re, sys
+import itertools
 from bs4 import BeautifulSoup
-import webvtt
-from datetime import datetime, timedelta
-import numpy as np
+from datetime import timedelta
 import subprocess
-from yt_dlp import YoutubeDL
 from io import StringIO
+from caption_track import CaptionTrack
+from youtube_cache import YoutubeCache
 
-def get_raw_timestamps(url):
+# tags inside the text of the cues, like <c> or <00:00:01.520>
+CUE_TAGS = re.compile('<.*?>')
+
+def get_vtt_subtitles(url, cache=None):
     """
-    Extract timestamps with text from a VTT file.
+    Download the automatic English subtitles of a video in VTT format.
 
     Args:
         url (str): URL of the video for which subtitles are to be extracted.
+        cache (YoutubeCache): Cache of the metadata and the captions, shared with the download of the video. None to not keep them.
 
     Returns:
-        list: A list of tuples containing the start time, end time, and text of each caption.
+        str: The content of the VTT file.
 
     Raises:
         None
     """
+    cache = cache or YoutubeCache(None)
+    return cache.get_vtt(url)
+
+def get_milliseconds_from_string(string):
+    """
+    Convert a VTT timestamp with format 'HH:MM:SS.mmm' or 'MM:SS.mmm' to integer milliseconds.
+
+    Args:
+        string (str): A timestamp with format 'HH:MM:SS.mmm' or 'MM:SS.mmm', the hours can have more than two digits.
+
+    Returns:
+        int: The milliseconds since the start of the video.
+
+    Raises:
+        ValueError: If the string is not a valid timestamp.
+    """
+    clock, _, milliseconds = string.strip().partition('.')
+    parts = clock.split(':')
+    if len(parts) not in (2, 3) or len(milliseconds) != 3 or len(parts[-1]) != 2 or len(parts[-2]) != 2:
+        raise ValueError(f'Invalid timestamp: {string}')
+    seconds = int(parts[-1]) + int(parts[-2]) * 60 + (int(parts[0]) * 3600 if len(parts) == 3 else 0)
+    return seconds * 1000 + int(milliseconds)
+
+def iterate_vtt_captions(lines):
+    """
+    Yields the captions of a VTT file while it is read, with their times in milliseconds.
 
-    # this is equivalent to the command above
-    ydl_opts = {'writeautomaticsub': True, 'skip_download': True, 'subtitlesformat': 'srt'}
-    with YoutubeDL(ydl_opts) as ydl:
-        #to get the srt captions as a string
-        subtitles_list = ydl.extract_info(url, download=False)['automatic_captions']['en']
-        # Now find the vtt subtitles in the list using the extension and a lambda function
-        vtt_subtitles_url = list(filter(lambda x: x['ext'] == 'vtt', subtitles_list))[0]['url']
-        # Download the vtt subtitles using the url and store them in a variable
-        vtt_subtitles = ydl.urlopen(vtt_subtitles_url).read().decode('utf-8')
-
-    timestamp = []
-    # Iterate through the captions in the vtt file with all the subtitles in the vtt_subtitles variable
-    subtitles_buffer = StringIO(vtt_subtitles)
-    for caption in webvtt.read_buffer(subtitles_buffer):
-        # Replace \n with spaces
-        caption_text = re.sub(r'\n', ' ', caption.text).strip()
-        timestamp.append((caption.start, caption.end, caption_text))
-    
-    return timestamp
+    Args:
+        lines (iterable): The lines of the VTT file, like a file object or a StringIO.
+
+    Returns:
+        generator: Tuples containing the start time (int), end time (int), and text of each caption, in the order of the file.
+
+    Raises:
+        ValueError: If a cue has an invalid timestamp.
+    """
+    block = []
+    is_header = True
+    # the empty line at the end closes the last block
+    for line in itertools.chain(lines, ['']):
+        line = line.rstrip('\n\r')
+        if line:
+            if block or line.strip():
+                block.append(line)
+            continue
+        if not block:
+            continue
+        # the first block is the WEBVTT header, then only cue blocks (a timing line in the first two lines) have captions,
+        # the NOTE and STYLE blocks are skipped
+        if not is_header and any('-->' in block_line for block_line in block[:2]):
+            times, text_lines = None, []
+            for index, block_line in enumerate(block):
+                if '-->' in block_line:
+                    # a second timing line starts another caption in the same block
+                    if times is not None:
+                        yield get_vtt_caption(times, text_lines)
+                        text_lines = []
+                    start, _, end = block_line.partition('-->')
+                    times = (get_milliseconds_from_string(start), get_milliseconds_from_string(end.split()[0]))
+                elif index > 0:
+                    # the first line is an identifier if it is not the timing line
+                    text_lines.append(block_line)
+            yield get_vtt_caption(times, text_lines)
+        is_header = False
+        block = []
+
+def get_vtt_caption(times, text_lines):
+    # Replace \n with spaces once the tags are removed
+    caption_text = re.sub(r'\n', ' ', CUE_TAGS.sub('', '\n'.join(text_lines))).strip()
+    return times + (caption_text,)
+
+def get_raw_timestamps(url, cache=None):
+    """
+    Extract timestamps with text from a VTT file.
+
+    Args:
+        url (str): URL of the video for which subtitles are to be extracted.
+        cache (YoutubeCache): Cache of the metadata and the captions, shared with the download of the video.
+
+    Returns:
+        list: A list of tuples containing the start time, end time (in milliseconds), and text of each caption.
+
+    Raises:
+        None
+    """
+    return list(iterate_vtt_captions(StringIO(get_vtt_subtitles(url, cache))))
 
 #write a function that takes the results from the get_timestamps function and transform timestamps in datetimes
 def get_timestamps(timestamps):
     """
-    Convert timestamps to datetime objects.
+    Convert timestamps to timedelta objects.
 
     Args:
-        timestamps (list): A list of tuples containing the start time, end time, and text of each caption.
+        timestamps (iterable): Tuples containing the start time, end time (in milliseconds), and text of each caption.
 
     Returns:
-        list: A list of tuples containing the start time, end time, and text of each caption as datetime objects.
+        list: A list of tuples containing the start time, end time, and text of each caption with the times as timedelta objects.
 
     Raises:
         None
     """
-    datetime_timestamps = []
-    for timestamp in timestamps:
-        start_time = get_timedelta_from_string(timestamp[0])
-        end_time = get_timedelta_from_string(timestamp[1])
-        datetime_timestamps.append((start_time, end_time, timestamp[2]))
-
-    return datetime_timestamps
+    return [(timedelta(milliseconds=timestamp[0]), timedelta(milliseconds=timestamp[1]), timestamp[2]) for timestamp in timestamps]
 
 def get_timedelta_from_string(string):
     """
-    Convert a string with format '%H:%M:%S.%f' to a timedelta object.
+    Convert a string with format 'HH:MM:SS.mmm' or 'MM:SS.mmm' to a timedelta object.
 
     Args:
-        string (str): A string with format '%H:%M:%S.%f'.
+        string (str): A string with format 'HH:MM:SS.mmm' or 'MM:SS.mmm'.
 
     Returns:
         datetime.timedelta: A timedelta object.
 
+    Raises:
+        ValueError: If the string is not a valid timestamp.
+    """
+    return timedelta(milliseconds=get_milliseconds_from_string(string))
+
+def iterate_filtered_adjacent_texts(timestamps):
+    """
+    Yields the captions not fully contained within the text of adjacent captions, like filter_adjacent_texts,
+    reading the captions one at a time so they can be filtered while they are parsed.
+
+    Args:
+        timestamps (iterable): Tuples containing the start time, end time, and text of each caption.
+
+    Returns:
+        generator: The tuples of the captions that are not fully contained within the text of adjacent captions.
+
     Raises:
         None
     """
-    return datetime.strptime(string, '%H:%M:%S.%f') - datetime.strptime('00:00:00.000', '%H:%M:%S.%f')
+    timestamps = iter(timestamps)
+    first = next(timestamps, None)
+    if first is None:
+        return
+    last = None
+
+    def iterate_interior():
+        # the captions between the first and the last one that are not contained in any of their neighbours
+        nonlocal last
+        prev = first
+        current = next(timestamps, None)
+        if current is None:
+            return
+        for following in timestamps:
+            if current[2] not in prev[2] and current[2] not in following[2]:
+                yield current
+            prev, current = current, following
+        last = current
+
+    interior = iterate_interior()
+    previous = next(interior, None)
+    if previous is None:
+        yield first
+        if last is not None:
+            yield last
+        return
+    # Include the first timestamp if it is not in the first kept one
+    if first[2] not in previous[2]:
+        yield first
+    yield previous
+    # then filters out the captions contained in the last kept one and the next one, the last interior one is always kept
+    current = next(interior, None)
+    if current is not None:
+        for following in interior:
+            if current[2] not in previous[2] + " " + following[2]:
+                yield current
+                previous = current
+            current = following
+        yield current
+    yield last
 
 def filter_adjacent_texts(timestamps):
     """
@@ -93,46 +212,39 @@ def filter_adjacent_texts(timestamps):
     Raises:
         None
     """
-    filtered_timestamps = []
-
-    # Iterate through the timestamps list, excluding the first and last elements
-    for i in range(1, len(timestamps) - 1):
-        current_text = timestamps[i][2]
-        prev_text = timestamps[i-1][2]
-        next_text = timestamps[i+1][2]
-
-        # Check if the current text is fully contained within the text of adjacent captions
-        if (current_text not in prev_text 
-            and current_text not in next_text):
-            filtered_timestamps.append(timestamps[i])
-
-    #filters out the timestamps that are not fully contained within the text of adjacent captions
-    i = 1
-    while i < len(filtered_timestamps) - 1:
-        current_text = filtered_timestamps[i][2]
-        prev_text = filtered_timestamps[i-1][2]
-        next_text = filtered_timestamps[i+1][2]
+    return list(iterate_filtered_adjacent_texts(timestamps))
 
-        if (current_text in prev_text + " " + next_text):
-            filtered_timestamps.pop(i)
-        else:
-            i += 1
+def iterate_filtered_timestamps(timestamps, n=10):
+    """
+    Yields the captions of filter_timestamps. An iterator is read one caption at a time, in linear time and with constant memory,
+    a list is filtered with filter_timestamps.
 
+    Args:
+        timestamps (iterable): Tuples containing the start time, end time, and text of each caption.
+        n (int): Maximum number of times the captions are filtered again.
 
-    # Include the first and last timestamps in the filtered list
-    if timestamps[0][2] not in filtered_timestamps[0][2]:
-        filtered_timestamps.insert(0, timestamps[0])
-    filtered_timestamps.append(timestamps[-1])
+    Returns:
+        generator: The tuples of the captions that are not fully contained within the text of adjacent captions.
 
-    return filtered_timestamps
+    Raises:
+        None
+    """
+    if hasattr(timestamps, '__len__'):
+        yield from filter_timestamps(timestamps, n)
+        return
+    # filtering captions that did not change leaves them the same again, so chaining the n + 1 filters
+    # gives the same captions as stopping once they do not change, and every caption goes through all of them in a single pass
+    for _ in range(n + 1):
+        timestamps = iterate_filtered_adjacent_texts(timestamps)
+    yield from timestamps
 
-#make a function that filters timestamps with filter_adjacent_texts until the list is not changed anymore or after n attempts
 def filter_timestamps(timestamps, n=10):
     """
     Filter out captions whose text is fully contained within the text of adjacent captions.
 
     Args:
-        timestamps (list): A list of tuples containing the start time, end time, and text of each caption.
+        timestamps (iterable): Tuples containing the start time, end time, and text of each caption.
+        n (int): Maximum number of times the captions are filtered again.
 
     Returns:
         list: A list of tuples containing the start time, end time, and text of each caption that is not fully contained within the text of adjacent captions.
@@ -140,57 +252,51 @@ def filter_timestamps(timestamps, n=10):
     Raises:
         None
     """
-    filtered_timestamps = filter_adjacent_texts(timestamps)
-    for i in range(n):
-        if filtered_timestamps == timestamps:
+    count = len(timestamps) if hasattr(timestamps, '__len__') else None
+    for _ in range(n + 1):
+        timestamps = filter_adjacent_texts(timestamps)
+        # a filter only drops captions, so one that keeps all of them changed nothing and the next ones would not either
+        if len(timestamps) == count:
             break
-        timestamps = filtered_timestamps
-        filtered_timestamps = filter_adjacent_texts(timestamps)
+        count = len(timestamps)
+    return timestamps
 
-    return filtered_timestamps
 
-
-def get_captions(url):
+def get_captions(url, cache=None):
     """
     Extract timestamps with text from a VTT file.
 
     Args:
         url (str): URL of the video for which subtitles are to be extracted.
+        cache (YoutubeCache): Cache of the metadata and the captions, shared with the download of the video.
 
     Returns:
-        list: A list of tuples containing the start time, end time, and text of each caption.
+        CaptionTrack: The captions, iterating it returns dicts with keys start_time, end_time (timedelta objects) and text.
 
     Raises:
         None
     """
-    timestamps = get_timestamps(filter_timestamps(get_raw_timestamps(url)))
-    captions = []
-    for timestamp in timestamps:
-        captions.append(timestamp[-1])
-
-    #returns the results in form of a list of dicts with keys start_time, end_time and text
-    return [{'start_time': timestamp[0], 
-             'end_time': timestamp[1], 
-             'text': timestamp[2]} 
-             for timestamp in timestamps]
+    # the times stay in milliseconds while the captions are parsed and filtered
+    return CaptionTrack.from_timestamps(filter_timestamps(iterate_vtt_captions(StringIO(get_vtt_subtitles(url, cache)))))
 
 def get_equally_separated_captions(captions, delta_seconds):
-    #creates a list of captions equally spaced by delta_seconds
-    #create a timedelta objects from delta_seconds
-    total_seconds = (captions[-1]['end_time'] - captions[0]['start_time']).total_seconds()
-    timestamps_list = list(np.arange(0, total_seconds, delta_seconds)) + [total_seconds]
-    timestamps_list = [timedelta(seconds = timestamp) for timestamp in timestamps_list]
-    spaced_captions = [{'start_time': timestamps_list[i], 
-                        'end_time': timestamps_list[i+1]} for i in range(len(timestamps_list) - 1)]
-    # add the rest of the elements to the closests spaced_captions elements
-    
-    for spaced_caption in spaced_captions:
-        for caption in captions:
-            if (spaced_caption['end_time'] < caption['end_time']):
-                # adds all elements on the same spaced_caption except start_time and end_time
-                spaced_caption.update({key: caption[key] for key in caption.keys() if key not in ['start_time', 'end_time']})
-                break
-    return spaced_captions
+    """
+    Creates a list of captions equally spaced by delta_seconds, each with the fields of the first caption that ends after it.
+
+    Args:
+        captions (CaptionTrack or list): The captions, or a list of dicts with keys start_time, end_time (timedelta objects) and text.
+        delta_seconds (float): Duration in seconds of each spaced caption.
+
+    Returns:
+        CaptionTrack or list: The spaced captions with keys start_time, end_time and the rest of the keys of the caption assigned to each of them,
+            a CaptionTrack if captions is a CaptionTrack and a list of dicts otherwise.
+
+    Raises:
+        None
+    """
+    if isinstance(captions, CaptionTrack):
+        return captions.resample(delta_seconds)
+    return CaptionTrack.from_captions(captions).resample(delta_seconds).to_captions()
 
 if __name__ == '__main__':
     url = 'https://www.youtube.com/watch?v=6ZfuNTqbHE8'
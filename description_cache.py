@@ -0,0 +1,62 @@
+# Description: This file contains a persistent cache of the descriptions generated for the captions
+import re
+import sqlite3
+import threading
+
+
+def normalise_text(text):
+    """
+    Returns the text used to look up a caption, without case and repeated whitespace
+    """
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+
+class DescriptionCache:
+    """
+    SQLite cache of the descriptions generated for the captions, keyed by the normalised text of the caption,
+    the model and the version of the prompt, so a description is never requested twice for the same caption
+    across runs. It can be used from several threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS descriptions '
+                                    '(text TEXT, model TEXT, prompt_version TEXT, description TEXT, '
+                                    'PRIMARY KEY (text, model, prompt_version))')
+
+    def get(self, text, model, prompt_version):
+        """
+        Returns the description cached for text, None if it is not in the cache
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT description FROM descriptions WHERE text = ? AND model = ? AND prompt_version = ?',
+                                          (normalise_text(text), model, prompt_version)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, text, model, prompt_version, description):
+        """
+        Saves the description of text, it is committed right away so it is kept if the run dies
+        """
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?)',
+                                    (normalise_text(text), model, prompt_version, description))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __str__(self):
+        return f'description cache: {self.hits} hits, {self.misses} misses'
@@ -1,50 +1,132 @@
 #!/usr/bin/env python3
 
 import os, sys, re
+import json
 from captions import get_captions, get_equally_separated_captions
-from datetime import datetime
 from tqdm import tqdm
-import subprocess
+import cv2
+import numpy as np
+from caption_track import CaptionTrack
+from youtube_cache import YoutubeCache
+
+# timestamps closer than this (in seconds) to a frame are considered to be on that frame
+FRAME_TIME_TOLERANCE = 1e-4
+
+# fields of the info dict of the downloaded video saved in video_format.json
+FORMAT_KEYS = ['format_id', 'format', 'ext', 'width', 'height', 'vcodec', 'acodec', 'fps', 'tbr', 'filesize', 'filesize_approx']
+
+def select_video_format(formats, target_resolution=None):
+    """
+    Selects the smallest mp4 video only format whose smaller side is at least target_resolution.
+
+    Args:
+        formats (list): The formats of the info dict of the video.
+        target_resolution (int): Minimum size in pixels of the smaller side of the frames, the largest format is selected when None
+            or when no format is large enough.
+
+    Returns:
+        dict: The selected format, None if there is no mp4 video only format with a known resolution.
+
+    Raises:
+        None
+    """
+    # OpenCV decodes the mp4 streams, h264 (avc1) is preferred over the other codecs of the same size
+    candidates = [video_format for video_format in formats
+                  if video_format.get('ext') == 'mp4' and video_format.get('vcodec') not in (None, 'none')
+                  and video_format.get('acodec') == 'none' and video_format.get('width') and video_format.get('height')]
+    if not candidates:
+        return None
+    def get_key(video_format):
+        size = video_format.get('filesize') or video_format.get('filesize_approx') or float('inf')
+        return (min(video_format['width'], video_format['height']), not video_format['vcodec'].startswith('avc1'),
+                size, video_format.get('tbr') or float('inf'))
+    large_enough = [video_format for video_format in candidates
+                    if target_resolution is not None and min(video_format['width'], video_format['height']) >= target_resolution]
+    if large_enough:
+        return min(large_enough, key=get_key)
+    return max(candidates, key=lambda video_format: (min(video_format['width'], video_format['height']), video_format.get('tbr') or 0))
 
 #write a method that extracts the frames from the youtube video given a list of timestamps and saves them in a folder
 #
-def extract_frames_from_yt_video(timestamps, url, frames_path = 'frames'):
+def extract_frames_from_yt_video(timestamps, url, frames_path = 'frames', cache=None, target_resolution=None, audio=False):
     """
     Extract frames from a YouTube video at the specified timestamps.
+    Only the smallest video stream with the target resolution is downloaded, without audio unless it is requested.
     
     Args:
-        timestamps (list): A list of tuples containing the start time, end time, and text of each caption.
+        timestamps (CaptionTrack or list): The captions with a frame_name field, or a list of dicts with at least the keys start_time (timedelta) and frame_name.
         url (str): URL of the video for which frames are to be extracted.
         frames_path (str): Path to the folder where the frames are to be saved.
+        cache (YoutubeCache): Cache of the metadata of the video, shared with get_captions so it is only extracted once.
+        target_resolution (int): Minimum size in pixels of the smaller side of the frames, the largest video is downloaded when None.
+        audio (bool): Download the audio too, muxed with the video.
     
     Returns:
-        None
+        dict: The fields of the downloaded format (format_id, width, height, vcodec...), also saved in video_format.json in frames_path.
     
     Raises:
-        None
+        yt_dlp.utils.DownloadError: If the video can not be downloaded.
     """
     #create a folder for the frames
     if not os.path.exists(frames_path):
         os.mkdir(frames_path)
     
     #download the video and stores the name of the file, uses the format mp4
-    os.system(f'yt-dlp --quiet -f bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4 --output "{frames_path}/%(title)s.%(ext)s" {url} ')
-
-    #gets the name of the file
-    # finds the mp4 file in the folder
-    filename = [filename for filename in os.listdir(frames_path) if filename.endswith('.mp4')][0]
+    cache = cache or YoutubeCache(None)
+    video_format = select_video_format(cache.get_info(url).get('formats') or [], target_resolution)
+    if video_format is None:
+        # the formats do not say which streams have video, let yt-dlp choose
+        format_selector = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4' if audio else 'bestvideo[ext=mp4]/mp4'
+    elif audio:
+        format_selector = f"{video_format['format_id']}+bestaudio[ext=m4a]/{video_format['format_id']}"
+    else:
+        format_selector = video_format['format_id']
+    ydl_opts = {'quiet': True, 'noprogress': True, 'format': format_selector, 'outtmpl': f'{frames_path}/%(title)s.%(ext)s'}
+    downloaded = cache.download(url, ydl_opts)
+    downloaded_format = {key: downloaded.get(key) for key in FORMAT_KEYS}
+    with open(os.path.join(frames_path, 'video_format.json'), 'w') as f:
+        json.dump(downloaded_format, f, indent=4)
+    tqdm.write(f"downloaded format {downloaded_format['format']}")
     #extract the frames
-    extract_video_frames(timestamps, frames_path + "/" + filename, frames_path)
+    extract_video_frames(timestamps, downloaded['requested_downloads'][0]['filepath'], frames_path)
+    return downloaded_format
 
 def extract_video_frames(timestamps, filename, frames_path = 'frames'):
-    for timestamp in tqdm(timestamps):
-        #convert the timestamps to hh:mm:ss format
-        start_time = (datetime(1,1,1) + timestamp['start_time']).strftime('%H:%M:%S.%f')
-        #to add fractions of seconds use %H:%M:%S.%f
-        end_time = (datetime(1,1,1) + timestamp['end_time']).strftime('%H:%M:%S.%f')
-        frame_name = timestamp['frame_name']
-        ffmpeg_command = f'ffmpeg -hide_banner -ss  {str(start_time)} -i "{filename}" -vframes 1  {frames_path}/{frame_name}.png 2>&1'
-        output = subprocess.check_output(ffmpeg_command, shell=True, stderr=subprocess.STDOUT)
+    """
+    Extract frames from a video file at the specified timestamps.
+    The video is opened once and decoded in order, every requested frame is written in a single pass.
+
+    Args:
+        timestamps (CaptionTrack or list): The captions with a frame_name field, or a list of dicts with at least the keys start_time (timedelta) and frame_name.
+        filename (str): Path to the video file.
+        frames_path (str): Path to the folder where the frames are to be saved.
+
+    Returns:
+        None
+
+    Raises:
+        IOError: If the video file can not be opened.
+    """
+    # timestamps are served in order, the first decoded frame at or after start_time is saved for each one
+    track = CaptionTrack.from_captions(timestamps)
+    order = np.argsort(track.start_time, kind='stable')
+    start_seconds = (track.start_time[order] / 10 ** 6).tolist()
+    frame_names = track.fields['frame_name'][order].tolist() if len(track) else []
+    capture = cv2.VideoCapture(filename)
+    if not capture.isOpened():
+        raise IOError(f'Could not open video file {filename}')
+    index = 0
+    with tqdm(total=len(track)) as progress:
+        while index < len(track) and capture.grab():
+            position = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            frame = None
+            while index < len(track) and start_seconds[index] <= position + FRAME_TIME_TOLERANCE:
+                if frame is None:
+                    _, frame = capture.retrieve()
+                cv2.imwrite(f"{frames_path}/{frame_names[index]}.png", frame)
+                index += 1
+                progress.update(1)
+    capture.release()
 
 if __name__ == "__main__":
     #url = sys.argv[1]
@@ -0,0 +1,114 @@
+# Description: This file contains the outputs of generate_frames_for_dir, where the generated frames are written
+import os
+import cv2
+from video_utils import FFmpegVideoWriter
+from job_manifest import JobManifest
+
+
+class FrameFolder:
+    """
+    Saves the generated frames as PNG files in a folder, the input frames are not written.
+    generate_frames_for_dir writes the pairs from its write threads, sequential outputs get the input frames too
+    and every frame in order from a single thread.
+    """
+    sequential = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, frames_path, filenames, settings):
+        """
+        Prepares the output for a job on the filenames of frames_path with settings (a dict of everything that changes the
+        generated frames), returns the names of the first frame of the pairs that are already completed
+        """
+        os.makedirs(self.path, exist_ok=True)
+        return set()
+
+    def write_pair(self, filename0, original, images):
+        """
+        Writes the list of (output_name, image) generated between filename0 and the next frame, original is the image of filename0
+        for sequential outputs and None for the other ones
+        """
+        for output_name, image in images:
+            cv2.imwrite(os.path.join(self.path, output_name), image)
+
+    def write_last(self, filename, original):
+        """
+        Writes the last frame of the job after all the pairs, only called for sequential outputs
+        """
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ResumableFrameFolder(FrameFolder):
+    """
+    Saves the generated frames as PNG files in their own folder and records every completed pair in a JobManifest,
+    so a job that died can be started again with resume and only interpolates the pairs that were not completed.
+    The manifest is manifest.jsonl in path when manifest_path is None.
+    """
+    def __init__(self, path, manifest_path=None, resume=False):
+        super().__init__(path)
+        self.manifest_path = manifest_path
+        self.resume = resume
+        self.manifest = None
+
+    def open(self, frames_path, filenames, settings):
+        if os.path.abspath(self.path) == os.path.abspath(frames_path):
+            # the generated frames would be taken as frames to interpolate
+            raise ValueError('the output folder must be a different folder than frames_path')
+        super().open(frames_path, filenames, settings)
+        self.manifest = JobManifest(self.manifest_path or os.path.join(self.path, 'manifest.jsonl'), settings, self.resume)
+        return set(self.manifest.completed)
+
+    def write_pair(self, filename0, original, images):
+        super().write_pair(filename0, original, images)
+        # only recorded once all its frames are on disk
+        self.manifest.record(filename0)
+
+    def close(self):
+        if self.manifest is not None:
+            self.manifest.close()
+
+
+class VideoOutput:
+    """
+    Pipes the input and generated frames in order into an mp4 video encoded with libx264, no PNG is written.
+    The video keeps the size of the first input frame, the generated frames are cropped to it.
+    """
+    sequential = True
+
+    def __init__(self, filename, framerate=30):
+        self.filename = filename
+        self.framerate = framerate
+        self.video = None
+
+    def open(self, frames_path, filenames, settings):
+        if filenames:
+            size = cv2.imread(os.path.join(frames_path, filenames[0]), cv2.IMREAD_UNCHANGED).shape[:2]
+            self.video = FFmpegVideoWriter(self.filename, self.framerate, size=size)
+        return set()
+
+    def write_pair(self, filename0, original, images):
+        self.video.write(original)
+        for _, image in images:
+            self.video.write(image)
+
+    def write_last(self, filename, original):
+        self.video.write(original)
+
+    def close(self):
+        if self.video is not None:
+            self.video.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,53 +1,336 @@
+import json
 import openai
-from openai.error import RateLimitError
+from openai.error import RateLimitError, ServiceUnavailableError, APIConnectionError, APIError, Timeout, TryAgain
 import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from description_cache import DescriptionCache, normalise_text
+
+# errors after which the same request can succeed if it is sent again later
+RETRYABLE_ERRORS = (RateLimitError, ServiceUnavailableError, APIConnectionError, Timeout, TryAgain)
+# changes the cache key, to be increased every time the prompts change
+PROMPT_VERSION = '1'
+BATCH_PROMPT_VERSION = 'batch-1'
+# tokens expected in every description, the prompt is estimated from its length
+COMPLETION_TOKENS = 200
 
 # write a function that calls openai chan complete api and returns the generated text
-def generate_image_descriptions(text, model):
+def get_prompt(text):
+    # increase PROMPT_VERSION when this changes
+    return f"""Generate an image description useful for stable-diffusion generator model based on this piece of text:
+    '{text}'
     """
-    Generate image descriptions for a given text using the OpenAI API.
+
+def get_batch_prompt(texts):
+    # increase BATCH_PROMPT_VERSION when this changes
+    return f"""Generate an image description useful for stable-diffusion generator model based on each of these pieces of text.
+    Answer only with a JSON list of strings with one description for each piece of text, in the same order:
+    {json.dumps(texts, ensure_ascii=False)}
+    """
+
+def estimate_tokens(prompt, descriptions=1):
+    """
+    Returns a rough estimate of the tokens used by a request with prompt, about 4 characters per token plus the completion
+    """
+    return len(prompt) // 4 + COMPLETION_TOKENS * descriptions
+
+def parse_batch_descriptions(content, count):
+    """
+    Returns the list of count descriptions in the answer to a batch prompt.
 
     Args:
-        text (str): Text to be described.
-        model (str): Name of the model to be used.
-        api_key (str): OpenAI API key.
+        content (str): The answer of the model, a JSON list that can be surrounded by other text like a code block.
+        count (int): Number of texts in the prompt.
 
     Returns:
-        str: Description of the text.
+        list: The description of every text.
 
     Raises:
-        None
+        ValueError: If the answer does not have a JSON list with count strings.
     """
-    prompt = f"""Generate an image description useful for stable-diffusion generator model based on this piece of text:
-    '{text}'
+    start, end = content.find('['), content.rfind(']')
+    if start == -1 or end < start:
+        raise ValueError('The answer does not have a JSON list')
+    descriptions = json.loads(content[start:end + 1])
+    if not isinstance(descriptions, list) or len(descriptions) != count \
+            or not all(isinstance(description, str) for description in descriptions):
+        raise ValueError(f'The answer is not a list of {count} descriptions')
+    return descriptions
+
+def get_batches(texts, batch_size, batch_tokens):
+    """
+    Splits texts in lists of consecutive texts with at most batch_size texts and batch_tokens estimated tokens each,
+    a text over batch_tokens goes alone
+    """
+    batches = []
+    for text in texts:
+        if batches and len(batches[-1]) < batch_size \
+                and estimate_tokens(get_batch_prompt(batches[-1] + [text]), len(batches[-1]) + 1) <= batch_tokens:
+            batches[-1].append(text)
+        else:
+            batches.append([text])
+    return batches
+
+def create_completion(prompt, model, **options):
+    """
+    Returns the answer to prompt and the total tokens used by the request
     """
     response = openai.ChatCompletion.create(
         model=model,
         messages=[
-            {"role": "user", "content": prompt}]
+            {"role": "user", "content": prompt}],
+        **options
             )
-    return response.choices[0].message.content
+    return response.choices[0].message.content, response.usage.total_tokens
+
+def generate_image_descriptions(text, model, return_usage=False, **options):
+    """
+    Generate image descriptions for a given text using the OpenAI API.
+
+    Args:
+        text (str): Text to be described.
+        model (str): Name of the model to be used.
+        return_usage (bool): Return the tokens used by the request too.
+        options: Other arguments of openai.ChatCompletion.create, like api_key, api_base or request_timeout.
+
+    Returns:
+        str: Description of the text, and the total tokens used with return_usage.
 
+    Raises:
+        openai.error.OpenAIError: If the request fails.
+    """
+    description, usage = create_completion(get_prompt(text), model, **options)
+    if return_usage:
+        return description, usage
+    return description
+
+
+def get_retry_delay(error, attempt, base_delay=1.0, max_delay=60.0):
+    """
+    Returns the seconds to wait before retrying a request after error, exponential with full jitter
+    and never shorter than the Retry-After header of the response
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    try:
+        delay = max(delay, float((getattr(error, 'headers', None) or {}).get('retry-after', 0)))
+    except (TypeError, ValueError):
+        pass
+    return delay
 
-def generate_image_descriptions_safely(text, model):
+def is_retryable(error):
+    # the server errors can be retried too, the client ones (invalid request, authentication) can not
+    return isinstance(error, RETRYABLE_ERRORS) or (isinstance(error, APIError) and (error.http_status or 0) >= 500)
+
+def generate_image_descriptions_safely(text, model, max_retries=6, **options):
     """
     Generate image descriptions for a given text using the OpenAI API. 
-    This function waits 5 seconds if the API returns an error.
+    This function retries the request with an exponential backoff if the API returns a rate limit or server error.
 
     Args:
         text (str): Text to be described.
         model (str): Name of the model to be used.
-        api_key (str): OpenAI API key.
+        max_retries (int): Maximum number of times the request is retried.
+        options: Other arguments of openai.ChatCompletion.create.
 
     Returns:
         str: Description of the text.
 
     Raises:
-        None
+        openai.error.OpenAIError: If the request fails with an error that can not be retried or after max_retries retries.
     """
-    try:
-        return generate_image_descriptions(text, model)
-    except RateLimitError:
-        print('Rate limit exceeded. Waiting 5 seconds...')
-        time.sleep(5)
-        return generate_image_descriptions_safely(text, model)
\ No newline at end of file
+    for attempt in range(max_retries + 1):
+        try:
+            return generate_image_descriptions(text, model, **options)
+        except Exception as error:
+            if not is_retryable(error) or attempt == max_retries:
+                raise
+            delay = get_retry_delay(error, attempt)
+            print(f'{type(error).__name__}, retrying in {delay:.1f} seconds...')
+            time.sleep(delay)
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket that refills at rate_per_minute tokens per minute up to capacity,
+    acquire blocks until the tokens are available.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        # more than the capacity could never be acquired
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def correct(self, amount):
+        """
+        Takes amount more tokens (or gives them back if it is negative) once the real usage is known, the bucket can go below 0
+        """
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+
+
+class DescriptionEngine:
+    """
+    Generates the descriptions of many texts with up to workers requests in flight, within the requests and tokens per minute
+    of the account. All the requests share the same token buckets, rate limit and server errors are retried with an exponential
+    backoff with jitter up to max_retries times, and the descriptions are returned in the order of the texts.
+    The texts that are the same once normalised are only requested once, and with cache_path the descriptions are kept
+    in a DescriptionCache so they are not requested again in later runs.
+    With batch_size over 1 up to batch_size texts are described in a single request, asking for a JSON list. The batches
+    whose answer can not be parsed are split in halves and requested again, down to the single text prompt.
+    """
+    def __init__(self, model, workers=8, requests_per_minute=3500, tokens_per_minute=90000, max_retries=6,
+                 base_delay=1.0, max_delay=60.0, cache_path=None, batch_size=1, batch_tokens=3500, **options):
+        """
+        Args:
+            model (str): Name of the model to be used.
+            workers (int): Maximum number of requests in flight.
+            requests_per_minute (int): Requests per minute allowed for the account.
+            tokens_per_minute (int): Tokens per minute allowed for the account.
+            max_retries (int): Maximum number of times a request is retried.
+            base_delay (float): Seconds to wait at most before the first retry, doubled for every retry.
+            max_delay (float): Maximum seconds to wait before a retry.
+            cache_path (str): Path of the SQLite file of the DescriptionCache, no cache when None.
+            batch_size (int): Maximum number of texts described in a single request.
+            batch_tokens (int): Maximum estimated tokens of a request with several texts, prompt and answer.
+            options: Other arguments of openai.ChatCompletion.create, like api_key or api_base to use a local server.
+        """
+        self.model = model
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.options = options
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.cache = DescriptionCache(cache_path) if cache_path is not None else None
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        # the descriptions of the batched prompt are not the same as the ones of the single text prompt
+        self.prompt_version = PROMPT_VERSION if batch_size == 1 else BATCH_PROMPT_VERSION
+        self.retries = 0
+        self.requests_sent = 0
+        self.batch_failures = 0
+        # descriptions that did not need a request, because of the cache or a repeated text
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def request(self, function, estimate):
+        """
+        Returns the answer and usage returned by function, a request with estimate tokens,
+        waiting for the rate limits and retrying the failed requests
+        """
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire()
+            self.tokens.acquire(estimate)
+            with self.lock:
+                self.requests_sent += 1
+            try:
+                answer, usage = function()
+            except Exception as error:
+                if not is_retryable(error) or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                time.sleep(get_retry_delay(error, attempt, self.base_delay, self.max_delay))
+                continue
+            self.tokens.correct(usage - estimate)
+            return answer
+
+    def describe_one(self, text):
+        """
+        Returns the description of text, waiting for the rate limits and retrying the failed requests
+        """
+        return self.request(lambda: generate_image_descriptions(text, self.model, return_usage=True, **self.options),
+                            estimate_tokens(get_prompt(text)))
+
+    def describe_batch(self, texts):
+        """
+        Returns the descriptions of texts requested together, split in smaller batches if the answer can not be parsed
+        """
+        if len(texts) == 1:
+            return [self.describe_one(texts[0])]
+        prompt = get_batch_prompt(texts)
+        answer = self.request(lambda: create_completion(prompt, self.model, **self.options), estimate_tokens(prompt, len(texts)))
+        try:
+            return parse_batch_descriptions(answer, len(texts))
+        except ValueError:
+            with self.lock:
+                self.batch_failures += 1
+            half = len(texts) // 2
+            return self.describe_batch(texts[:half]) + self.describe_batch(texts[half:])
+
+    def describe_and_cache(self, texts):
+        descriptions = self.describe_batch(texts)
+        if self.cache is not None:
+            for text, description in zip(texts, descriptions):
+                self.cache.put(text, self.model, self.prompt_version, description)
+        return descriptions
+
+    def describe(self, texts, progress=True):
+        """
+        Returns the descriptions of texts in the same order.
+
+        Args:
+            texts (list): Texts to be described.
+            progress (bool): Show a progress bar and the number of requests saved.
+
+        Returns:
+            list: The description of every text.
+
+        Raises:
+            openai.error.OpenAIError: If a request fails with an error that can not be retried or after max_retries retries.
+        """
+        keys = [normalise_text(text) for text in texts]
+        # the first of the texts with the same key is the one sent
+        unique = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+        descriptions = {}
+        if self.cache is not None:
+            for key, text in unique.items():
+                description = self.cache.get(text, self.model, self.prompt_version)
+                if description is not None:
+                    descriptions[key] = description
+        missing = [key for key in unique if key not in descriptions]
+        batches = get_batches([unique[key] for key in missing], self.batch_size, self.batch_tokens)
+        requests_sent = self.requests_sent
+        with ThreadPoolExecutor(self.workers) as executor, \
+                tqdm(total=len(missing), desc='Generating descriptions', disable=not progress) as bar:
+            futures = [executor.submit(self.describe_and_cache, batch) for batch in batches]
+            for batch, future in zip(batches, futures):
+                future.add_done_callback(lambda _, count=len(batch): bar.update(count))
+            try:
+                missing_descriptions = [description for future in futures for description in future.result()]
+            except BaseException:
+                # the pending requests are not sent once one has failed
+                for future in futures:
+                    future.cancel()
+                raise
+        descriptions.update(zip(missing, missing_descriptions))
+        self.saved += len(texts) - len(missing)
+        if progress:
+            tqdm.write(f'{self.requests_sent - requests_sent} requests for {len(texts)} texts, '
+                       f'{len(texts) - len(missing)} descriptions without a request'
+                       + (f', {self.cache}' if self.cache is not None else ''))
+        return [descriptions[key] for key in keys]
@@ -0,0 +1,105 @@
+# Description: This file contains an on disk cache for the frames generated between pairs of frames
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MAX_BYTES = 10 * 2 ** 30
+
+
+class InterpolationCache:
+    """
+    Cache of the frames generated between pairs of frames, keyed by the content of both frames and the settings of the interpolation
+    (model weights, number of frames or timesteps, etc.). Each entry is a compressed npz file with the uint8 images in cache_path,
+    the least recently used entries are deleted when the cache grows over max_bytes.
+    Several processes can share cache_path, each one only counts the entries it found when it was created and the ones it saved,
+    so the total size stays under the sum of their max_bytes.
+    """
+    def __init__(self, cache_path, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_path, exist_ok=True)
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # entries ordered from the least to the most recently used, with their size in bytes
+        self.entries = OrderedDict()
+        found = []
+        for entry in os.scandir(cache_path):
+            try:
+                if entry.name.endswith('.npz'):
+                    found.append((entry.stat().st_mtime, entry.name[:-len('.npz')], entry.stat().st_size))
+            except FileNotFoundError:
+                # evicted by another process meanwhile
+                pass
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+        self.size = sum(self.entries.values())
+
+    @staticmethod
+    def get_key(img0, img1, settings):
+        """
+        Returns the key of the pair of frames (tensors) for the settings (str) of the interpolation
+        """
+        h = hashlib.sha256(settings.encode())
+        for img in [img0, img1]:
+            h.update(str(tuple(img.shape)).encode())
+            h.update(img.detach().cpu().numpy().tobytes())
+        return h.hexdigest()
+
+    def get_filename(self, key):
+        return os.path.join(self.cache_path, key + '.npz')
+
+    def get(self, key):
+        """
+        Returns the list of images cached for key, None if it is not in the cache
+        """
+        if key in self.entries:
+            try:
+                with np.load(self.get_filename(key)) as data:
+                    images = list(data['images'])
+            except (OSError, ValueError, KeyError):
+                # the entry was deleted or is corrupted
+                self.remove(key)
+            else:
+                try:
+                    os.utime(self.get_filename(key))
+                except FileNotFoundError:
+                    pass
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return images
+        self.misses += 1
+        return None
+
+    def put(self, key, images):
+        """
+        Saves the list of images (numpy arrays with the same shape) for key, evicting the least recently used entries if needed
+        """
+        if not images:
+            return
+        # written to a temporary file of its own first, so a crash never leaves a truncated entry
+        # and other processes saving the same key never write to the same file
+        fd, temporary_filename = tempfile.mkstemp(suffix='.tmp', dir=self.cache_path)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, images=np.stack(images))
+            size = f.tell()
+        os.replace(temporary_filename, self.get_filename(key))
+        if key in self.entries:
+            self.size -= self.entries[key]
+        self.entries[key] = size
+        self.entries.move_to_end(key)
+        self.size += self.entries[key]
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        self.size -= self.entries.pop(key)
+        try:
+            os.remove(self.get_filename(key))
+        except FileNotFoundError:
+            # already removed by another process
+            pass
+
+    def __str__(self):
+        return f'cache: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries, {self.size / 2 ** 20:.1f} MB'
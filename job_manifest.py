@@ -0,0 +1,62 @@
+# Description: This file contains the manifest used to resume interpolation jobs
+import os
+import json
+import threading
+
+
+class JobManifest:
+    """
+    Append only record of the pairs of frames completed by an interpolation job, used to resume it after a crash.
+    The first line holds the settings of the job and every completed pair is appended as a JSON line flushed to disk,
+    a last line cut by a crash is discarded when the manifest is loaded.
+    """
+    def __init__(self, path, settings, resume=False):
+        self.path = path
+        self.completed = set()
+        self.lock = threading.Lock()
+        if resume and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.load(settings)
+            self.file = open(path, 'a')
+        else:
+            self.file = open(path, 'w')
+            self.write({'settings': settings})
+
+    def load(self, settings):
+        # compared as they are read back from JSON, where tuples become lists
+        settings = json.loads(json.dumps(settings))
+        with open(self.path, 'r+') as f:
+            content = f.read()
+            if not content.endswith('\n'):
+                # drop the line that was being written when the job died
+                f.seek(0)
+                f.truncate(len(content[:content.rfind('\n') + 1].encode()))
+                content = content[:content.rfind('\n') + 1]
+        for line in content.splitlines():
+            record = json.loads(line)
+            if 'settings' in record:
+                if record['settings'] != settings:
+                    raise ValueError(f'{self.path} was created by a job with different settings: {record["settings"]}')
+            else:
+                self.completed.add(record['pair'])
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record(self, filename0):
+        """
+        Records the pair starting at filename0 as completed, all its frames must be already written
+        """
+        with self.lock:
+            self.write({'pair': filename0})
+            self.completed.add(filename0)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
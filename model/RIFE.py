@@ -16,11 +16,14 @@ from model.refine import *
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     
 class Model:
-    def __init__(self, local_rank=-1, arbitrary=False):
+    def __init__(self, local_rank=-1, arbitrary=False, inference_only=False):
         if arbitrary == True:
             self.flownet = IFNet_m()
         else:
             self.flownet = IFNet()
+        if inference_only:
+            # no optimizer nor losses, the caller moves the model to its device
+            return
         self.device()
         self.optimG = AdamW(self.flownet.parameters(), lr=1e-6, weight_decay=1e-3) # use large weight decay may avoid NaN loss
         self.epe = EPE()
@@ -35,8 +38,8 @@ class Model:
     def eval(self):
         self.flownet.eval()
 
-    def device(self):
-        self.flownet.to(device)
+    def device(self, target=None):
+        self.flownet.to(target or device)
 
     def load_model(self, path, rank=0):
         def convert(param):
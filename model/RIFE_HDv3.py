@@ -9,12 +9,19 @@ from torch.nn.parallel import DistributedDataParallel as DDP
 from model.IFNet_HDv3 import *
 import torch.nn.functional as F
 from model.loss import *
+import os
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from model.model_hash import get_model_hash
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     
 class Model:
-    def __init__(self, local_rank=-1):
+    def __init__(self, local_rank=-1, inference_only=False):
         self.flownet = IFNet()
+        if inference_only:
+            # no optimizer nor losses, the caller moves the model to its device
+            return
         self.device()
         self.optimG = AdamW(self.flownet.parameters(), lr=1e-6, weight_decay=1e-4)
         self.epe = EPE()
@@ -29,8 +36,8 @@ class Model:
     def eval(self):
         self.flownet.eval()
 
-    def device(self):
-        self.flownet.to(device)
+    def device(self, target=None):
+        self.flownet.to(target or device)
 
     def load_model(self, path, rank=0):
         def convert(param):
@@ -57,6 +64,15 @@ class Model:
         scale_list = [4/scale, 2/scale, 1/scale]
         flow, mask, merged = self.flownet(imgs, scale_list)
         return merged[2]
+
+    def estimate_flow(self, img0, img1, scale=1.0):
+        """
+        Returns the final flow (img0 and img1 to the middle frame) and blending mask of the network, without merging
+        """
+        imgs = torch.cat((img0, img1), 1)
+        scale_list = [4/scale, 2/scale, 1/scale]
+        flow, mask, merged = self.flownet(imgs, scale_list)
+        return flow[2], mask
     
     def update(self, imgs, gt, learning_rate=0, mul=1, training=True, flow_gt=None):
         for param_group in self.optimG.param_groups:
@@ -86,3 +102,148 @@ class Model:
             'loss_cons': loss_cons,
             'loss_smooth': loss_smooth,
             }
+
+
+class MergedOutput(nn.Module):
+    """
+    Returns only the final merged frame of an IFNet for a fixed scale_list, used to trace the network
+    """
+    def __init__(self, flownet, scale_list):
+        super(MergedOutput, self).__init__()
+        self.flownet = flownet
+        self.scale_list = scale_list
+
+    def forward(self, x):
+        flow, mask, merged = self.flownet(x, self.scale_list)
+        return merged[2]
+
+def bf16_supported():
+    """
+    Returns True when the cpu has native bfloat16 support for the convolutions
+    """
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+class InferenceModel(Model):
+    """
+    Inference only version of Model: the IFNet is frozen, the unused teacher block is dropped and the weights use the
+    channels last memory format. With jit='trace' the network is traced with TorchScript, frozen and optimized for
+    inference, the traced module of each input shape is cached on disk next to flownet.pkl. With jit='compile' it is
+    wrapped with torch.compile.
+    precision can reduce the precision of the IFBlock convolutions: 'bf16' runs them under bfloat16 autocast (fp32 is
+    used when the cpu has no bfloat16 support) and 'int8' quantizes the conv stacks statically, calibrated on the
+    first pair of frames interpolated. 'int8' is only available on the cpu.
+    """
+    quantized_layers = ['conv0', 'convblock0', 'convblock1', 'convblock2', 'convblock3', 'conv1', 'conv2']
+
+    def __init__(self, jit=None, precision='fp32'):
+        super(InferenceModel, self).__init__(inference_only=True)
+        if precision not in ['fp32', 'bf16', 'int8']:
+            raise ValueError('Unknown precision {}'.format(precision))
+        if jit is not None and precision != 'fp32':
+            raise ValueError('jit is only available with fp32 precision')
+        if precision == 'bf16' and not bf16_supported():
+            print('bfloat16 is not supported by this cpu, using fp32')
+            precision = 'fp32'
+        self.jit = jit
+        self.precision = precision
+        self.calibrated = precision != 'int8'
+        self.path = None
+        self.traced = {}
+        if jit == 'compile':
+            self.compiled = torch.compile(self.flownet)
+
+    def device(self, target=None):
+        self.target = torch.device(target or device)
+        if self.precision == 'int8' and self.target.type != 'cpu':
+            raise ValueError('int8 precision is only available on the cpu')
+        self.flownet.to(self.target, memory_format=torch.channels_last)
+        self.traced = {}
+
+    def load_model(self, path, rank=0):
+        super(InferenceModel, self).load_model(path, rank)
+        self.path = path
+        del self.flownet.block_tea
+        self.flownet.requires_grad_(False)
+        self.flownet.eval()
+        # names the traced modules saved on disk, so they are traced again when the weights change
+        self.weights_hash = get_model_hash(self)[:16]
+        if self.precision == 'int8':
+            self.prepare_quantization()
+
+    def get_blocks(self):
+        return [self.flownet.block0, self.flownet.block1, self.flownet.block2]
+
+    def prepare_quantization(self):
+        """
+        Inserts the observers in the conv stacks of the IFBlocks, they are quantized by calibrate
+        """
+        qconfig_mapping = get_default_qconfig_mapping('x86')
+        for block in self.get_blocks():
+            for name in self.quantized_layers:
+                layer = getattr(block, name)
+                in_channels = next(module for module in layer.modules()
+                                   if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d))).in_channels
+                setattr(block, name, prepare_fx(layer, qconfig_mapping, (torch.rand(1, in_channels, 32, 32),)))
+
+    def calibrate(self, imgs, scale_list):
+        """
+        Runs the observed network on imgs and converts the conv stacks to int8
+        """
+        with torch.no_grad():
+            self.flownet(imgs, scale_list)
+        for block in self.get_blocks():
+            for name in self.quantized_layers:
+                setattr(block, name, convert_fx(getattr(block, name)))
+        self.calibrated = True
+
+    def get_traced(self, imgs, scale_list):
+        """
+        Returns the traced network for the shape of imgs, loading it from disk or tracing and saving it the first time.
+        The file name has the hash of the weights and the torch version, a module traced with other ones is never loaded.
+        """
+        key = (str(self.target), tuple(imgs.shape), tuple(scale_list))
+        if key not in self.traced:
+            filename = '{}/flownet_traced_{}_{}_{}_{}_torch{}.pt'.format(
+                self.path, self.target.type, 'x'.join(map(str, imgs.shape)), '_'.join(map(str, scale_list)),
+                self.weights_hash, torch.__version__.replace('+', '_'))
+            if os.path.exists(filename):
+                traced = torch.jit.load(filename, map_location=self.target)
+            else:
+                # tracing runs under no_grad, inference tensors can not be traced
+                with torch.no_grad():
+                    # warp caches the grid of every shape on its first call, a warm-up call fills the cache so the
+                    # tracing and the check run of torch.jit.trace both read the same cached grid as a constant
+                    self.flownet(imgs, scale_list)
+                    traced = torch.jit.trace(MergedOutput(self.flownet, scale_list).eval(), imgs)
+                    traced = torch.jit.freeze(traced)
+                torch.jit.save(traced, filename)
+            # the optimized module can not be serialized, only the frozen one is cached
+            self.traced[key] = torch.jit.optimize_for_inference(traced)
+        return self.traced[key]
+
+    def inference(self, img0, img1, scale=1.0):
+        scale_list = [4/scale, 2/scale, 1/scale]
+        imgs = torch.cat((img0, img1), 1).contiguous(memory_format=torch.channels_last)
+        if self.jit == 'trace':
+            traced = self.get_traced(imgs, scale_list)
+            with torch.inference_mode():
+                return traced(imgs)
+        flow, mask, merged = self.run_flownet(imgs, scale_list)
+        return merged[2].float()
+
+    def estimate_flow(self, img0, img1, scale=1.0):
+        scale_list = [4/scale, 2/scale, 1/scale]
+        imgs = torch.cat((img0, img1), 1).contiguous(memory_format=torch.channels_last)
+        flow, mask, merged = self.run_flownet(imgs, scale_list)
+        return flow[2].float(), mask.float()
+
+    def run_flownet(self, imgs, scale_list):
+        if not self.calibrated:
+            self.calibrate(imgs, scale_list)
+        with torch.inference_mode(), torch.autocast(self.target.type, dtype=torch.bfloat16,
+                                                    enabled=self.precision == 'bf16'):
+            flownet = self.compiled if self.jit == 'compile' else self.flownet
+            return flownet(imgs, scale_list)
@@ -0,0 +1,23 @@
+import hashlib
+import torch
+
+
+def get_model_hash(model):
+    """
+    Returns a hash of the weights of the network of a model
+    """
+    h = hashlib.sha256()
+    for name, tensor in sorted(model.flownet.state_dict().items()):
+        h.update(name.encode())
+        tensor = tensor.detach().cpu()
+        if tensor.is_quantized:
+            # the integer values with the parameters that map them back to floats
+            if tensor.qscheme() in (torch.per_tensor_affine, torch.per_tensor_symmetric):
+                h.update(repr((tensor.q_scale(), tensor.q_zero_point())).encode())
+            else:
+                h.update(tensor.q_per_channel_scales().numpy().tobytes())
+                h.update(tensor.q_per_channel_zero_points().numpy().tobytes())
+                h.update(repr(tensor.q_per_channel_axis()).encode())
+            tensor = tensor.int_repr()
+        h.update(tensor.numpy().tobytes())
+    return h.hexdigest()
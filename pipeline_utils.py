@@ -0,0 +1,103 @@
+# Description: This file contains helpers to overlap the I/O stages of the frame pipelines with the model inference
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class StageCounter:
+    """
+    Counts the frames processed by a pipeline stage and the time spent processing them.
+    The time is summed over all the threads of the stage, so frames_per_second is the throughput of a single worker.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, frames, seconds):
+        with self.lock:
+            self.frames += frames
+            self.seconds += seconds
+
+    @contextmanager
+    def measure(self, frames=1):
+        start = time.perf_counter()
+        yield
+        self.add(frames, time.perf_counter() - start)
+
+    def frames_per_second(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {'frames': self.frames, 'seconds': self.seconds, 'frames_per_second': self.frames_per_second()}
+
+    def __str__(self):
+        return f'{self.name}: {self.frames} frames, {self.frames_per_second():.1f} frames/s'
+
+
+def prefetch_map(function, items, workers=0, depth=8):
+    """
+    Yields function(item) for every item in order, computing up to depth results ahead in a pool of threads.
+
+    Args:
+        function (callable): Function applied to every item.
+        items (iterable): Items to be processed.
+        workers (int): Number of threads, with 0 the items are processed lazily in the calling thread.
+        depth (int): Maximum number of results computed ahead of the consumer.
+
+    Returns:
+        generator: The results in the same order as items.
+
+    Raises:
+        Any exception raised by function, when its result is reached.
+    """
+    if workers == 0:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class WriteBehindPool:
+    """
+    Runs submitted tasks in a pool of threads without waiting for them, at most depth tasks are pending at any time.
+    With 0 workers the tasks are run synchronously on submit.
+    Exceptions raised by the tasks are raised again on a later submit or on close.
+    """
+    def __init__(self, workers=0, depth=8):
+        self.executor = ThreadPoolExecutor(workers) if workers else None
+        self.slots = threading.BoundedSemaphore(depth)
+        self.pending = deque()
+
+    def submit(self, function, *args):
+        if self.executor is None:
+            function(*args)
+            return
+        self.slots.acquire()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append(future)
+        while self.pending and self.pending[0].done():
+            self.pending.popleft().result()
+
+    def close(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        while self.pending:
+            self.pending.popleft().result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -6,6 +6,7 @@ from PIL import Image
 import torch
 import os
 from rife_interpolate import generate_frames_for_dir
+from frame_outputs import VideoOutput
 from image_utils import get_canny_image, squarify_image
 from video_utils import get_video_length
 
@@ -37,7 +38,7 @@ for i, timestamp in enumerate(timestamps):
 
 #reconstruct the video
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-generate_frames_for_dir(device, output_path, n=2)
+generate_frames_for_dir(device, output_path, n=2, output=VideoOutput(output_video))
 
 if __name__ == '__main__':
     print('Reconstructing video...')
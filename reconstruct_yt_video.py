@@ -5,8 +5,9 @@ from captions import get_captions, get_equally_separated_captions
 from extract_video_frames import extract_frames_from_yt_video
 import torch
 from rife_interpolate import generate_frames_for_dir
-from generate_descriptions import generate_image_descriptions_safely
-from tqdm import tqdm
+from frame_outputs import VideoOutput
+from generate_descriptions import DescriptionEngine
+from youtube_cache import YoutubeCache
 
 import openai
 # gets the api key from a file called api_key.txt
@@ -19,15 +20,18 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     frames_path = 'frames'
     url = 'https://www.youtube.com/watch?v=IyJFBVm3Qlg'
-    timestamps = get_captions(url)
-    for timestamp in tqdm(timestamps, desc = 'Generating descriptions'):
-        timestamp['description'] = generate_image_descriptions_safely(timestamp['text'], 
-                                                               'gpt-3.5-turbo')
+    # the metadata of the video is extracted once for the captions and the download, and kept for the next runs
+    cache = YoutubeCache()
+    timestamps = get_captions(url, cache)
+    # the captions are sent in batches of 20, concurrently within the rate limits of the account
+    engine = DescriptionEngine('gpt-3.5-turbo', cache_path='descriptions.sqlite', batch_size=20)
+    timestamps.set_field('description', engine.describe([timestamp['text'] for timestamp in timestamps]))
     timestamps = get_equally_separated_captions(timestamps, 0.2)
-    for index, timestamp in enumerate(timestamps):
-        timestamp.update({'frame_name': f'{index:04d}_0000'}) 
-    extract_frames_from_yt_video(timestamps, url, frames_path)
-    generate_frames_for_dir(device, frames_path, n=2)
+    timestamps.set_field('frame_name', [f'{index:04d}_0000' for index in range(len(timestamps))])
+    # only the smallest video stream with at least 480p is downloaded, the output video has no audio
+    extract_frames_from_yt_video(timestamps, url, frames_path, cache, target_resolution=480)
+    generate_frames_for_dir(device, frames_path, n=2, output=VideoOutput('output.mp4'))
 
-# for generating a video withput overwritng frames, use the following command:
+# the video is encoded directly into output.mp4, to keep the interpolated frames as PNG files instead
+# call generate_frames_for_dir without output and use the following command:
 # ffmpeg -framerate 30 -pattern_type glob -i 'frames/*_*.png' -c:v libx264 -profile:v high -crf 20 -pix_fmt yuv420p output.mp4
@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
 # write a function that interpolates between two images using the model.RIFE_HD and returns the interpolated image
 
-from model.RIFE_HDv3 import Model
+from model.RIFE_HDv3 import Model, InferenceModel
+from model.RIFE import Model as ArbitraryModel
+from model.pytorch_msssim import msssim
 import torch
 import cv2
 import torch.nn.functional as F
 import os
+import re
+import json
+import math
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from pipeline_utils import StageCounter, WriteBehindPool, prefetch_map
+from scene_detection import classify_pair, fill_frames
+from interpolation_cache import InterpolationCache
+from model.model_hash import get_model_hash
+from frame_outputs import FrameFolder, ResumableFrameFolder
 
 class RIFEModel(Model):
     def inference(self, img0, img1, scale=1):
@@ -15,23 +29,157 @@ class RIFEModel(Model):
         flow, mask, merged = self.flownet(imgs, scale_list)
         return merged[2]
 
-# write a method that returns the model already initialized
-def get_model():
-    model = Model()
-    model.load_model("model/train_log", -1)
-    model.eval()
-    model.device()
-    return model
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = get_model()
+FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# names of the generated frames, like 0000_0001.png, the input frames are 0000_0000.png or 0000.png
+GENERATED_FRAME_NAME = re.compile(r'\d+_0*[1-9]\d*\.')
+# estimated peak memory in bytes per pixel of the flow estimation and of the tiles of interpolate_tiled
+FLOW_BYTES_PER_PIXEL = 768
+TILE_BYTES_PER_PIXEL = 128
+models = {}
+models_lock = threading.Lock()
+
+# write a method that returns the model already initialized
+def get_model(model_device=None, optimized=False, jit=None, precision='fp32'):
+    """
+    Returns the model loaded on model_device (the default device when None).
+    The model is built for inference only and loaded on the first call for each device and options, later calls return the same model.
+    With optimized the frozen, channels last InferenceModel is used, jit can then be 'trace' or 'compile' (see InferenceModel).
+    precision 'bf16' or 'int8' always uses the InferenceModel with reduced precision convolutions.
+    """
+    model_device = torch.device(model_device or device)
+    key = (model_device, optimized, jit, precision)
+    with models_lock:
+        if key not in models:
+            if optimized or precision != 'fp32':
+                model = InferenceModel(jit, precision)
+            else:
+                model = Model(inference_only=True)
+            model.load_model("model/train_log", -1)
+            model.eval()
+            model.device(model_device)
+            models[key] = model
+    return models[key]
+
+def get_arbitrary_model(model_device=None, path="model/train_log_m"):
+    """
+    Returns the RIFE model with the IFNet_m network, which interpolates at arbitrary timesteps, loaded on model_device.
+    Like get_model it is built for inference only and loaded only on the first call for each device.
+    """
+    model_device = torch.device(model_device or device)
+    key = (model_device, 'arbitrary', path)
+    with models_lock:
+        if key not in models:
+            model = ArbitraryModel(arbitrary=True, inference_only=True)
+            model.load_model(path, -1)
+            model.eval()
+            model.device(model_device)
+            models[key] = model
+    return models[key]
 
-def interpolate(img0, img1):
+def interpolate(img0, img1, model=None):
     """
     Interpolates between two images using the model.RIFE_HD and returns the interpolated image
+    The model of get_model on the device of the images is used when model is None
     """
+    model = model or get_model(img0.device)
     image = model.inference(img0, img1)
     return image
 
+def get_tiling(shape, memory_budget):
+    """
+    Returns the downscale factor of the flow estimation and the side of the tiles for frames of shape (n, c, h, w),
+    so the estimated peak memory of interpolate_tiled stays within memory_budget bytes
+    """
+    n, c, h, w = shape
+    # the two frames and the output stay at full resolution
+    available = memory_budget - 3 * n * c * h * w * 4
+    factor = 1
+    while n * (h // factor) * (w // factor) * FLOW_BYTES_PER_PIXEL > available and min(h, w) // factor > 64:
+        factor *= 2
+    tile = int(math.sqrt(max(available, 0) / (n * TILE_BYTES_PER_PIXEL))) // 32 * 32
+    return factor, max(tile, 32)
+
+def sample(img, x, y, align_corners):
+    """
+    Samples img bilinearly at the pixel coordinates x, y of shape (n, th, tw), clamping to the border
+    """
+    _, _, h, w = img.shape
+    if align_corners:
+        grid = torch.stack((2 * x / (w - 1) - 1, 2 * y / (h - 1) - 1), -1)
+    else:
+        grid = torch.stack(((2 * x + 1) / w - 1, (2 * y + 1) / h - 1), -1)
+    return F.grid_sample(img, grid, mode='bilinear', padding_mode='border', align_corners=align_corners)
+
+@torch.no_grad()
+def interpolate_tiled(img0, img1, model=None, memory_budget=2 ** 30):
+    """
+    Interpolates between two images with bounded memory for very high resolution frames.
+    The flow is estimated on frames downscaled until the estimate fits in memory_budget (in bytes), then it is upsampled,
+    and the frames are warped and blended one tile at a time. Every output pixel samples the low resolution flow at its
+    exact position, so tiles do not need to overlap and there are no seams. With a budget big enough for the full frame
+    the result matches interpolate.
+    """
+    model = model or get_model(img0.device)
+    n, c, h, w = img0.shape
+    factor, tile = get_tiling(img0.shape, memory_budget)
+    small0, small1 = img0, img1
+    if factor > 1:
+        small0 = F.interpolate(img0, scale_factor=1. / factor, mode="bilinear", align_corners=False)
+        small1 = F.interpolate(img1, scale_factor=1. / factor, mode="bilinear", align_corners=False)
+    _, _, sh, sw = small0.shape
+    flow, mask = model.estimate_flow(pad_frame_for_interpolation(small0), pad_frame_for_interpolation(small1))
+    flow, mask = flow[:, :, :sh, :sw], mask[:, :, :sh, :sw]
+    flow_scale = torch.tensor([w / sw, h / sh, w / sw, h / sh], device=flow.device).view(1, 4, 1, 1)
+    flow = flow * flow_scale
+
+    output = torch.empty_like(img0)
+    for y0 in range(0, h, tile):
+        for x0 in range(0, w, tile):
+            y = torch.arange(y0, min(y0 + tile, h), device=img0.device, dtype=img0.dtype)
+            x = torch.arange(x0, min(x0 + tile, w), device=img0.device, dtype=img0.dtype)
+            y, x = torch.meshgrid(y, x, indexing='ij')
+            y, x = y.expand(n, -1, -1), x.expand(n, -1, -1)
+            # same as upsampling the flow and mask to the full frame with F.interpolate
+            tile_flow = sample(flow, x * sw / w, y * sh / h, align_corners=False)
+            tile_mask = sample(mask, x * sw / w, y * sh / h, align_corners=False)
+            # same as model.warplayer.warp
+            warped0 = sample(img0, x + tile_flow[:, 0], y + tile_flow[:, 1], align_corners=True)
+            warped1 = sample(img1, x + tile_flow[:, 2], y + tile_flow[:, 3], align_corners=True)
+            output[:, :, y0:y0 + tile, x0:x0 + tile] = warped0 * tile_mask + warped1 * (1 - tile_mask)
+    return output
+
+@torch.no_grad()
+def interpolate_timesteps(img0, img1, timesteps, model=None):
+    """
+    Interpolates the frames at the given timesteps (between 0 and 1) between img0 and img1 in a single forward pass,
+    using the arbitrary timestep model of get_arbitrary_model when model is None.
+    Returns a list with one tensor shaped like img0 per timestep, in the order of timesteps.
+    Raises a ValueError if model is not an arbitrary timestep model, the other ones only interpolate the middle frame.
+    """
+    model = model or get_arbitrary_model(img0.device)
+    if not isinstance(model, ArbitraryModel):
+        raise ValueError('interpolate_timesteps needs an arbitrary timestep model, see get_arbitrary_model')
+    k, n = len(timesteps), img0.shape[0]
+    # every pair is repeated once per timestep, the timesteps of the i-th repetition are all timesteps[i]
+    timestep = torch.tensor(timesteps, dtype=img0.dtype, device=img0.device).repeat_interleave(n).view(-1, 1, 1, 1)
+    merged = model.inference(img0.repeat(k, 1, 1, 1), img1.repeat(k, 1, 1, 1), timestep=timestep)
+    return list(merged.split(n))
+
+
+def measure_quality(img0, img1, model, reference_model=None):
+    """
+    Returns the PSNR (dB) and MS-SSIM of the frame interpolated with model against the one interpolated with reference_model,
+    the fp32 model of get_model when None. Used to check the quality of the reduced precision models.
+    """
+    reference_model = reference_model or get_model(img0.device)
+    with torch.no_grad():
+        reference = interpolate(img0, img1, reference_model)
+        frame = interpolate(img0, img1, model)
+        mse = ((frame - reference) ** 2).mean().item()
+        psnr = 10 * math.log10(1 / mse) if mse > 0 else float('inf')
+        return psnr, msssim(frame, reference, val_range=1).item()
+
 
 def get_image_for_interpolation(img, device):
     """
@@ -39,62 +187,432 @@ def get_image_for_interpolation(img, device):
     """
     return (torch.tensor(img.transpose(2, 0, 1)).to(device) / 255.).unsqueeze(0)
 
-def resize_frames_for_interpolation(img0, img1):
-    n, c, h, w = img0.shape
+def pad_frame_for_interpolation(img):
+    """
+    Pads the image so its height and width are multiples of 32
+    """
+    n, c, h, w = img.shape
     ph = ((h - 1) // 32 + 1) * 32
     pw = ((w - 1) // 32 + 1) * 32
     padding = (0, pw - w, 0, ph - h)
-    img0 = F.pad(img0, padding)
-    img1 = F.pad(img1, padding)
-    return img0, img1
+    return F.pad(img, padding)
 
-def generate_frames(img0, img1, n=1):
+def resize_frames_for_interpolation(img0, img1):
+    return pad_frame_for_interpolation(img0), pad_frame_for_interpolation(img1)
+
+def load_frame_for_interpolation(device, path):
+    """
+    Reads an image and returns it normalised and padded for interpolation
+    """
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    return pad_frame_for_interpolation(get_image_for_interpolation(img, device))
+
+def iterate_frame_pairs(device, frames_path, filenames, io_workers=0, queue_depth=8, counter=None, skip=()):
+    """
+    Yields (filename0, img0, img1) for every pair of consecutive frames in filenames.
+    Each frame is read, normalised and padded only once and reused for both pairs it belongs to.
+    The pairs whose first frame is in skip are not yielded, and frames only used by them are not read.
+
+    Args:
+        device (torch.device): Device where the frames are loaded.
+        frames_path (str): Path to the folder with the frames.
+        filenames (list): Sorted names of the frames.
+        io_workers (int): Number of threads decoding the upcoming frames in the background, 0 decodes them on demand.
+        queue_depth (int): Maximum number of frames decoded ahead.
+        counter (pipeline_utils.StageCounter): Counter for the decoded frames.
+        skip (set): Names of the first frame of the pairs to be skipped.
+
+    Returns:
+        generator: Tuples with the name of the first frame of the pair and both padded frames.
+
+    Raises:
+        None
+    """
+    counter = counter or StageCounter('decode')
+
+    def load(filename):
+        with counter.measure():
+            return load_frame_for_interpolation(device, os.path.join(frames_path, filename))
+
+    pending = [index < len(filenames) - 1 and filenames[index] not in skip for index in range(len(filenames))]
+    needed = [index for index in range(len(filenames)) if pending[index] or (index > 0 and pending[index - 1])]
+    previous_index, previous_img = None, None
+    for index, img in zip(needed, prefetch_map(load, [filenames[index] for index in needed], io_workers, queue_depth)):
+        if previous_index == index - 1 and pending[previous_index]:
+            yield filenames[previous_index], previous_img, img
+        previous_index, previous_img = index, img
+
+def list_frames(frames_path):
+    """
+    Returns the sorted names of the input frames in frames_path, the frames generated by an earlier run in the same folder are left out
+    """
+    return sorted(filename for filename in os.listdir(frames_path)
+                  if filename.lower().endswith(FRAME_EXTENSIONS) and not GENERATED_FRAME_NAME.match(filename))
+
+@torch.no_grad()
+def generate_frames(img0, img1, n=1, model=None, memory_budget=None, batched=False):
     """
-    Generates 2**n - 1 frames between img0 and img1
+    Generates 2**n - 1 frames between img0 and img1 with model (see interpolate)
+    With memory_budget (in bytes) the frames are interpolated with interpolate_tiled
+    img0 and img1 can hold a batch of pairs, every midpoint is interpolated on its own unless batched
+    With batched all the midpoints of a recursion level are computed in a single forward pass, it is faster but not bit exact:
+    the convolutions round differently for other batch sizes, so the frames can differ by one uint8 level
+    The frames stay on the device of img0 and img1, they are only copied to the host when saved
     """
+    def run(images0, images1):
+        if memory_budget is None:
+            return interpolate(images0, images1, model)
+        return interpolate_tiled(images0, images1, model, memory_budget)
+
     frames = [img0, img1]
     for i in range(n):
+        images0, images1 = torch.cat(frames[:-1]), torch.cat(frames[1:])
+        if batched:
+            mids = run(images0, images1)
+        else:
+            mids = torch.cat([run(images0[index:index + 1], images1[index:index + 1]) for index in range(images0.shape[0])])
+        mids = mids.split(img0.shape[0])
         new_frames = []
-        for image0, image1 in zip(frames, frames[1:]):
-            mid = interpolate(image0, image1).cpu().detach().numpy()
-            mid = torch.tensor(mid).to(device)
+        for image0, mid in zip(frames, mids):
             new_frames.append(image0)
             new_frames.append(mid)
         new_frames.append(frames[-1])
         frames = new_frames
     return frames[1:-1]
 
-def generate_frames_for_dir(device, frames_path, n=1):
+def get_output_names(filename0, count):
     """
-    Generate frames for a given directory of frames. frames_path should contain the frames in the format 0000_0000.png, 0001_0000.png, etc.
-    
+    Returns the names of the count frames generated after the frame filename0
+    """
+    start_frame_name = int(filename0.split(".")[0].split("_")[0])
+    # save the image in frames like 0000_0000.png if it was interpolated between 0000.png and 0001.png, 0000_0001.png if it was interpolated between 0000.png and 0001.png, etc.
+    return ["{:04d}_{:04d}.png".format(start_frame_name, index + 1) for index in range(count)]
+
+def iterate_interpolated_frames(frames, filenames):
+    """
+    Yields (output_name, image) for the frames generated for a batch of pairs, the frames of the b-th pair are named after filenames[b]
+
     Args:
-        device (torch.device): Device to be used for interpolation.
+        frames (list): List of tensors of shape (batch, c, h, w) as returned by generate_frames.
+        filenames (list): Names of the first frame of each pair of the batch.
+
+    Returns:
+        generator: Tuples with the output file name and the image as a numpy array ready for cv2.imwrite.
+
+    Raises:
+        None
+    """
+    for batch_index, filename0 in enumerate(filenames):
+        for output_name, frame in zip(get_output_names(filename0, len(frames)), frames):
+            _, _, h, w = frame.shape
+            yield output_name, (frame[batch_index] * 255).byte().cpu().numpy().transpose(1, 2, 0)[:h, :w]
+
+def save_interpolated_frames(frames, filenames, frames_path):
+    """
+    Saves the frames generated for a batch of pairs, the frames of the b-th pair are named after filenames[b]
+
+    Args:
+        frames (list): List of tensors of shape (batch, c, h, w) as returned by generate_frames.
+        filenames (list): Names of the first frame of each pair of the batch.
         frames_path (str): Path to the folder where the frames are to be saved.
-        n (int): log base 2 of the number of frames to be generated plus one between each pair of frames. For example, if n = 1, then 1 frames will be generated between each pair of frames, if n = 2, then 3 frames will be generated between each pair of frames, if n = 3, then 7 frames will be generated between each pair of frames, etc.
 
     Returns:
         None
-    
+
     Raises:
         None
     """
-    files_tuples = [(filename0, filename1) for filename0, filename1 in zip(sorted(os.listdir(frames_path)), sorted(os.listdir(frames_path))[1:])]
-    for filename0, filename1 in tqdm(files_tuples):
-        img0 = cv2.imread(os.path.join(frames_path, filename0), cv2.IMREAD_UNCHANGED)
-        img1 = cv2.imread(os.path.join(frames_path, filename1), cv2.IMREAD_UNCHANGED)
-        img0 = get_image_for_interpolation(img0, device)
-        img1 = get_image_for_interpolation(img1, device)
-        img0, img1 = resize_frames_for_interpolation(img0, img1)
-        frames = generate_frames(img0, img1, n)
-        for index, frame in enumerate(frames):
-            _, _, h, w = img0.shape
-            start_frame_name = int(filename0.split(".")[0].split("_")[0])
-            # save the image in frames like 0000_0000.png if it was interpolated between 0000.png and 0001.png, 0000_0001.png if it was interpolated between 0000.png and 0001.png, etc.
-            output_name = "{:04d}_{:04d}.png".format(start_frame_name, index + 1)
-            ffmpeg_command = (frame[0] * 255).cpu().byte().numpy().transpose(1, 2, 0)[:h, :w]
-            cv2.imwrite(os.path.join(frames_path, output_name), ffmpeg_command)
+    for output_name, image in iterate_interpolated_frames(frames, filenames):
+        cv2.imwrite(os.path.join(frames_path, output_name), image)
+
+def get_original_image(img):
+    """
+    Returns the image of a normalised frame of a batch of one as a numpy array ready for cv2.imwrite
+    """
+    return (img[0] * 255).round().byte().cpu().numpy().transpose(1, 2, 0)
+
+class PairInterpolator:
+    """
+    Generates the frames of the pairs of generate_frames_for_dir with model: 2**n - 1 frames by recursive bisection,
+    or the frames at timesteps with an arbitrary timestep model. With cache the pairs already cached do not run the model.
+    """
+    def __init__(self, model, n=1, timesteps=None, memory_budget=None, batched=False, cache=None):
+        self.model = model
+        self.n = n
+        self.timesteps = timesteps
+        self.memory_budget = memory_budget
+        self.batched = batched
+        self.cache = cache
+        self.settings = None
+
+    def get_timesteps(self, filename0):
+        """
+        Returns the sorted timesteps of the frames generated between filename0 and the next frame
+        """
+        if self.timesteps is None:
+            return [index / 2 ** self.n for index in range(1, 2 ** self.n)]
+        return sorted(self.timesteps.get(filename0, []) if isinstance(self.timesteps, dict) else self.timesteps)
+
+    def get_settings(self, img0, img1):
+        """
+        Returns everything that changes the generated frames except the pair and its timesteps, as a string for the keys of the cache
+        """
+        if self.settings is None:
+            if not getattr(self.model, 'calibrated', True):
+                # int8 models are calibrated on the first pair they interpolate, their weights are only known after it
+                self.model.inference(img0, img1)
+            self.settings = repr((get_model_hash(self.model), type(self.model).__name__, getattr(self.model, 'precision', 'fp32'),
+                                  self.memory_budget, self.batched))
+        return self.settings
+
+    def interpolate(self, batch):
+        """
+        Returns the list of (output_name, image) generated for each (filename0, img0, img1) pair of batch
+        """
+        pair_images = [None] * len(batch)
+        keys = [None] * len(batch)
+        if self.cache is not None:
+            for index, (filename0, img0, img1) in enumerate(batch):
+                keys[index] = self.cache.get_key(img0, img1, self.get_settings(img0, img1) + repr(self.get_timesteps(filename0)))
+                images = self.cache.get(keys[index])
+                if images is not None:
+                    pair_images[index] = list(zip(get_output_names(filename0, len(images)), images))
+        missing = [index for index, images in enumerate(pair_images) if images is None]
+        if self.timesteps is not None:
+            for index in missing:
+                filename0, img0, img1 = batch[index]
+                pair_timesteps = self.get_timesteps(filename0)
+                frames = interpolate_timesteps(img0, img1, pair_timesteps, self.model) if pair_timesteps else []
+                pair_images[index] = list(iterate_interpolated_frames(frames, [filename0]))
+        elif missing:
+            frames = generate_frames(torch.cat([batch[index][1] for index in missing]),
+                                     torch.cat([batch[index][2] for index in missing]),
+                                     self.n, self.model, self.memory_budget, self.batched)
+            images = list(iterate_interpolated_frames(frames, [batch[index][0] for index in missing]))
+            frames_per_pair = 2 ** self.n - 1
+            for position, index in enumerate(missing):
+                pair_images[index] = images[position * frames_per_pair:(position + 1) * frames_per_pair]
+        if self.cache is not None:
+            for index in missing:
+                self.cache.put(keys[index], [image for _, image in pair_images[index]])
+        return pair_images
+
+def generate_frames_for_dir(device, frames_path, n=1, batch_size=1, io_workers=0, queue_depth=8, output=None, model=None,
+                            memory_budget=None, timesteps=None, scene_detection=False, cut_fill='hold', cache=None,
+                            stats_path=None, filenames=None):
+    """
+    Generate frames for a given directory of frames. frames_path should contain the frames in the format 0000_0000.png, 0001_0000.png, etc.
+    The generated frames are written to output (see frame_outputs): PNG files in a folder (frames_path by default), PNG files
+    in their own folder with a manifest to resume the job, or an mp4 video with the input frames too.
+    With io_workers > 0 the upcoming frames are decoded and the generated frames are encoded and written in background threads while the model runs.
+    With timesteps the frames are generated at arbitrary timesteps with the IFNet_m model instead of by recursive bisection.
+    With scene_detection every pair is first classified (see scene_detection.classify_pair), only normal pairs run the model.
+
+    Args:
+        device (torch.device): Device to be used for interpolation.
+        frames_path (str): Path to the folder with the frames.
+        n (int): log base 2 of the number of frames to be generated plus one between each pair of frames. For example, if n = 1, then 1 frames will be generated between each pair of frames, if n = 2, then 3 frames will be generated between each pair of frames, if n = 3, then 7 frames will be generated between each pair of frames, etc.
+        batch_size (int): Number of consecutive pairs of frames with the same shape interpolated in a single forward pass. With more than one
+            the midpoints of every recursion level are batched too (see generate_frames with batched), it is faster but not bit exact,
+            the frames can differ by one uint8 level from the ones of batch_size 1.
+        io_workers (int): Number of threads of each of the decode and write pools, 0 runs everything sequentially.
+        queue_depth (int): Maximum number of frames waiting in each of the decode and write queues.
+        output (frame_outputs.FrameFolder or frame_outputs.VideoOutput): Where the frames are written, FrameFolder(frames_path) when None.
+            It is opened and closed by generate_frames_for_dir.
+        model (model.RIFE_HDv3.Model): Model used for the interpolation, get_model(device) when None, or get_arbitrary_model(device) with timesteps.
+            With a reduced precision model (see get_model) the PSNR and MS-SSIM of the first pair against fp32 are printed.
+        memory_budget (int): Approximate peak memory in bytes of each interpolation, see interpolate_tiled. None interpolates the full frames at once.
+        timesteps (list or dict): Timesteps between 0 and 1 of the frames generated between every pair, or a dict with the timesteps of each pair by the name of its first frame (pairs missing get no frames). n is ignored.
+        scene_detection (bool): Fill the frames of duplicate pairs with copies of the first frame and the frames of scene cuts according to cut_fill instead of interpolating them.
+        cut_fill (str): 'hold' to repeat the first frame of a scene cut, 'crossfade' to blend both frames.
+        cache (interpolation_cache.InterpolationCache): Cache of the frames generated for each pair, pairs already in the cache do not run the model. None disables it.
+        stats_path (str): Path of a JSON file where the number of pairs of each kind, the stage counters and the cache counters are saved, None does not save them.
+        filenames (list): Sorted names of the frames to be interpolated, all the input frames of frames_path when None (see list_frames).
+
+    Returns:
+        dict: The StageCounter of each stage (decode, interpolate and encode, and duplicate and cut with scene_detection) with the frames/s of the run.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails to encode the video of a VideoOutput.
+        ValueError: If the folder of a ResumableFrameFolder is frames_path, if the manifest to resume belongs to a job with other settings,
+            or if timesteps are used with a model that is not an arbitrary timestep model.
+    """
+    filenames = filenames if filenames is not None else list_frames(frames_path)
+    output = output or FrameFolder(frames_path)
+    model = model or (get_arbitrary_model(device) if timesteps is not None else get_model(device))
+    if timesteps is not None and not isinstance(model, ArbitraryModel):
+        # checked before the output is opened, a manifest would record a job that can not run
+        raise ValueError('timesteps need an arbitrary timestep model, see get_arbitrary_model')
+    precision = getattr(model, 'precision', 'fp32')
+    interpolator = PairInterpolator(model, n, timesteps, memory_budget, batch_size > 1, cache)
+    stages = ['decode', 'interpolate', 'encode'] + (['duplicate', 'cut'] if scene_detection else [])
+    counters = {stage: StageCounter(stage) for stage in stages}
+    pair_kinds = {'normal': 0, 'duplicate': 0, 'cut': 0}
+    batch = []
+
+    def write_pair(filename0, original, images):
+        with counters['encode'].measure(len(images) + (original is not None)):
+            output.write_pair(filename0, original, images)
+
+    def write_last(filename, original):
+        with counters['encode'].measure():
+            output.write_last(filename, original)
+
+    def submit_pair(filename0, img0, images):
+        writer.submit(write_pair, filename0, get_original_image(img0) if output.sequential else None, images)
+
+    def fill_pair(filename0, img0, img1, kind):
+        start = time.perf_counter()
+        frames = fill_frames(img0, img1, interpolator.get_timesteps(filename0), kind, cut_fill)
+        images = list(iterate_interpolated_frames(frames, [filename0]))
+        counters[kind].add(len(images), time.perf_counter() - start)
+        submit_pair(filename0, img0, images)
+
+    def flush():
+        if precision != 'fp32' and not counters['interpolate'].frames:
+            psnr, quality = measure_quality(batch[0][1], batch[0][2], model)
+            tqdm.write(f'{precision} against fp32: PSNR {psnr:.2f} dB, MS-SSIM {quality:.4f}')
+        start = time.perf_counter()
+        pair_images = interpolator.interpolate(batch)
+        counters['interpolate'].add(sum(len(images) for images in pair_images), time.perf_counter() - start)
+        for (filename0, img0, _), images in zip(batch, pair_images):
+            submit_pair(filename0, img0, images)
+        batch.clear()
+        progress.set_postfix({stage: f'{counter.frames_per_second():.1f}fps' for stage, counter in counters.items()})
+
+    # everything that changes the generated frames, the model is always the same one
+    job_settings = {'n': n, 'timesteps': timesteps, 'memory_budget': memory_budget, 'batched': batch_size > 1,
+                    'precision': precision, 'scene_detection': scene_detection, 'cut_fill': cut_fill}
+    with output:
+        skip = output.open(frames_path, filenames, job_settings)
+        pending_pairs = sum(filename not in skip for filename in filenames[:-1])
+        if skip:
+            tqdm.write(f'resuming: {len(filenames) - 1 - pending_pairs} pairs already completed, {pending_pairs} left')
+        pairs = iterate_frame_pairs(device, frames_path, filenames, io_workers, queue_depth, counters['decode'], skip)
+        # the frames of a video have to be written in order by a single thread
+        write_workers = min(io_workers, 1) if output.sequential else io_workers
+        with WriteBehindPool(write_workers, queue_depth) as writer, tqdm(pairs, total=pending_pairs) as progress:
+            img1 = None
+            for filename0, img0, img1 in progress:
+                kind = classify_pair(img0, img1) if scene_detection else 'normal'
+                pair_kinds[kind] += 1
+                if kind != 'normal':
+                    # the pending pairs go first so the frames stay in order
+                    if batch:
+                        flush()
+                    fill_pair(filename0, img0, img1, kind)
+                    continue
+                # only pairs with the same padded shape can be stacked in a batch
+                if batch and batch[0][1].shape != img0.shape:
+                    flush()
+                batch.append((filename0, img0, img1))
+                if len(batch) == batch_size:
+                    flush()
+            if batch:
+                flush()
+            if output.sequential and img1 is not None:
+                writer.submit(write_last, filenames[-1], get_original_image(img1))
+    if cache is not None:
+        tqdm.write(str(cache))
+    if scene_detection:
+        tqdm.write('pairs: ' + ', '.join(f'{count} {kind}' for kind, count in pair_kinds.items()))
+    if stats_path is not None:
+        with open(stats_path, 'w') as f:
+            stats = {'pairs': pair_kinds, 'stages': {stage: counter.to_dict() for stage, counter in counters.items()}}
+            if cache is not None:
+                stats['cache'] = {'hits': cache.hits, 'misses': cache.misses}
+            json.dump(stats, f, indent=4)
+    return counters
         
+def split_frames(filenames, shards):
+    """
+    Splits the sorted filenames in at most shards lists of consecutive frames with about the same number of pairs.
+    Consecutive lists share their boundary frame, so every pair of frames is in exactly one list.
+    """
+    pairs = len(filenames) - 1
+    bounds = [round(index * pairs / shards) for index in range(shards + 1)]
+    return [filenames[bounds[index]:bounds[index + 1] + 1] for index in range(shards) if bounds[index + 1] > bounds[index]]
+
+def generate_frames_for_shard(shard_device, frames_path, filenames, threads, precision, options):
+    """
+    Worker of generate_frames_for_dir_sharded, interpolates the pairs of filenames on shard_device with threads intra-op threads
+    and a model with precision. Returns the frames and seconds of each stage counter.
+    """
+    shard_device = torch.device(shard_device)
+    if threads is not None:
+        torch.set_num_threads(threads)
+    if shard_device.type == 'cuda':
+        # so the kernels and the tensors created without a device index go to the device of the worker
+        torch.cuda.set_device(shard_device)
+    if options.get('timesteps') is not None:
+        model = get_arbitrary_model(shard_device)
+    else:
+        model = get_model(shard_device, precision=precision)
+    counters = generate_frames_for_dir(shard_device, frames_path, model=model, filenames=filenames, **options)
+    return {stage: (counter.frames, counter.seconds) for stage, counter in counters.items()}
+
+def generate_frames_for_dir_sharded(frames_path, workers=None, devices=None, precision='fp32', **options):
+    """
+    Generate frames for a given directory of frames like generate_frames_for_dir, splitting the pairs of frames between worker processes.
+    Each worker interpolates a block of consecutive pairs with its own model. With batch_size 1 the output files are the same as in
+    a single process run, larger batches are split differently at the boundaries of the blocks and can differ by one uint8 level.
+    
+    Args:
+        frames_path (str): Path to the folder where the frames are to be saved.
+        workers (int): Number of worker processes, one per device when None.
+        devices (list): Devices of the workers, assigned in turn. All the cuda devices when None, or the cpu when there is none.
+        precision (str): Precision of the model of every worker, see get_model. Only 'fp32' with timesteps.
+        options: Other arguments of generate_frames_for_dir, model, stats_path, filenames and a VideoOutput output are not supported.
+            With a ResumableFrameFolder output every worker keeps its own manifest in its folder, resuming needs the same number of workers.
+            With a cache the workers share its folder, each one can fill an equal part of its max_bytes.
+
+    Returns:
+        dict: The StageCounter of each stage summed over all the workers.
+    
+    Raises:
+        ValueError: If an unsupported option is given, or if precision is not 'fp32' with timesteps.
+    """
+    for option in ['model', 'stats_path', 'filenames']:
+        if options.get(option) is not None:
+            raise ValueError(f'{option} is not supported by generate_frames_for_dir_sharded')
+    output = options.get('output')
+    if output is not None and output.sequential:
+        # the workers would write their frames in any order
+        raise ValueError('sequential outputs are not supported by generate_frames_for_dir_sharded')
+    if options.get('timesteps') is not None and precision != 'fp32':
+        # the arbitrary timestep model only runs in fp32
+        raise ValueError('precision is only supported without timesteps')
+    if devices is None:
+        if torch.cuda.is_available():
+            devices = [f'cuda:{index}' for index in range(torch.cuda.device_count())]
+        else:
+            devices = ['cpu']
+    workers = workers or len(devices)
+    shards = split_frames(list_frames(frames_path), workers)
+    shard_devices = [devices[index % len(devices)] for index in range(len(shards))]
+    # the cores are split between the cpu workers so they do not oversubscribe them
+    cpu_workers = sum(torch.device(shard_device).type == 'cpu' for shard_device in shard_devices)
+    threads = max(1, (os.cpu_count() or 1) // cpu_workers) if cpu_workers else None
+    counters = {}
+    # spawned workers do not inherit the threads and the cuda state of this process
+    with ProcessPoolExecutor(max(len(shards), 1), mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = []
+        for index, (shard_device, shard) in enumerate(zip(shard_devices, shards)):
+            shard_options = dict(options)
+            if isinstance(output, ResumableFrameFolder):
+                shard_options['output'] = ResumableFrameFolder(
+                    output.path, os.path.join(output.path, f'manifest_{index}_of_{len(shards)}.jsonl'), output.resume)
+            if options.get('cache') is not None:
+                # every worker only evicts the entries it knows, so their parts add up to max_bytes
+                cache = options['cache']
+                shard_options['cache'] = InterpolationCache(cache.cache_path, cache.max_bytes // len(shards))
+            futures.append(executor.submit(generate_frames_for_shard, shard_device, frames_path, shard,
+                                           threads if torch.device(shard_device).type == 'cpu' else None, precision, shard_options))
+        for future in futures:
+            for stage, (frames, seconds) in future.result().items():
+                counters.setdefault(stage, StageCounter(stage)).add(frames, seconds)
+    return counters
+
 if __name__ == "__main__":  
     for filename0, filename1 in zip(sorted(os.listdir("frames")), sorted(os.listdir("frames"))[1:]):
         img0 = cv2.imread('frames/' + filename0, cv2.IMREAD_UNCHANGED)
@@ -111,6 +629,7 @@ if __name__ == "__main__":
             new_var = (frame[0] * 255).byte().numpy().transpose(1, 2, 0)[:h, :w]
             cv2.imwrite('frames/{}'.format(output_name), new_var)
         
+# to encode the video directly instead of saving the frames use generate_frames_for_dir(device, 'frames', output=frame_outputs.VideoOutput('output.mp4'))
 # for concatenating all the frames into a video called output.mp4 use this ffmpeg command
 # ffmpeg -framerate 30 -pattern_type glob -i 'frames/*_*.png' -c:v libx264 -profile:v high -crf 20 -pix_fmt yuv420p output.mp4
  
\ No newline at end of file
@@ -0,0 +1,5 @@
+# the modules of the repository are at the top level, so the tests import them from there
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
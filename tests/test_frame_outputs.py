@@ -0,0 +1,34 @@
+# Tests of frame_outputs.py without the model, the pairs are written like generate_frames_for_dir does
+import os
+import numpy as np
+import pytest
+from frame_outputs import FrameFolder, ResumableFrameFolder
+
+SETTINGS = {'n': 1}
+
+
+def get_images(filename0, count=1):
+    return [(f'{filename0[:4]}_{index + 1:04d}.png', np.full((8, 8, 3), index, dtype=np.uint8)) for index in range(count)]
+
+
+def test_frame_folder(tmp_path):
+    path = str(tmp_path / 'frames')
+    with FrameFolder(path) as output:
+        assert output.open(path, ['0000_0000.png', '0001_0000.png'], SETTINGS) == set()
+        output.write_pair('0000_0000.png', None, get_images('0000_0000.png', 2))
+    assert sorted(os.listdir(path)) == ['0000_0001.png', '0000_0002.png']
+
+
+def test_resumable_frame_folder(tmp_path):
+    filenames = [f'{index:04d}_0000.png' for index in range(3)]
+    path = str(tmp_path / 'output')
+    with ResumableFrameFolder(path) as output:
+        assert output.open(str(tmp_path), filenames, SETTINGS) == set()
+        output.write_pair(filenames[0], None, get_images(filenames[0]))
+    with ResumableFrameFolder(path, resume=True) as output:
+        assert output.open(str(tmp_path), filenames, SETTINGS) == {filenames[0]}
+    assert sorted(os.listdir(path)) == ['0000_0001.png', 'manifest.jsonl']
+    with pytest.raises(ValueError):
+        ResumableFrameFolder(path, resume=True).open(str(tmp_path), filenames, {'n': 2})
+    with pytest.raises(ValueError):
+        ResumableFrameFolder(str(tmp_path)).open(str(tmp_path), filenames, SETTINGS)
@@ -0,0 +1,64 @@
+# Tests of interpolation_cache.py, with several caches on the same folder like the workers of generate_frames_for_dir_sharded
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from interpolation_cache import InterpolationCache
+
+
+def get_images(seed, count=2):
+    return [np.random.default_rng(seed).integers(0, 256, (16, 16, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def get_size(cache_path):
+    return sum(entry.stat().st_size for entry in os.scandir(cache_path) if entry.name.endswith('.npz'))
+
+
+def put_keys(cache_path, keys):
+    cache = InterpolationCache(cache_path)
+    for key in keys:
+        cache.put(key, get_images(int(key)))
+        cache.get(key)
+    return cache.hits
+
+
+def test_put_and_get(tmp_path):
+    cache = InterpolationCache(str(tmp_path))
+    cache.put('a', get_images(0))
+    assert all((image == expected).all() for image, expected in zip(cache.get('a'), get_images(0)))
+    assert cache.get('b') is None
+    # a new cache on the same folder finds the entry
+    assert InterpolationCache(str(tmp_path)).get('a') is not None
+    assert [name for name in os.listdir(tmp_path) if not name.endswith('.npz')] == []
+
+
+def test_entries_removed_by_another_cache(tmp_path):
+    cache0 = InterpolationCache(str(tmp_path))
+    cache0.put('a', get_images(0))
+    cache1 = InterpolationCache(str(tmp_path))
+    cache1.put('a', get_images(0))
+    cache0.remove('a')
+    cache1.remove('a')
+    cache0.put('b', get_images(1))
+    cache1 = InterpolationCache(str(tmp_path))
+    os.remove(cache0.get_filename('b'))
+    assert cache1.get('b') is None and 'b' not in cache1.entries
+
+
+def test_size_of_several_caches(tmp_path):
+    cache = InterpolationCache(str(tmp_path))
+    cache.put('0', get_images(0))
+    entry_size = cache.size
+    caches = [InterpolationCache(str(tmp_path), 4 * entry_size) for _ in range(3)]
+    for index in range(30):
+        caches[index % 3].put(str(index), get_images(index))
+    # every cache keeps its last 4 entries
+    assert 3 * 3 * entry_size < get_size(tmp_path) <= 3 * 4 * entry_size
+
+
+def test_processes_saving_the_same_keys(tmp_path):
+    keys = [str(index % 5) for index in range(40)]
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('spawn')) as executor:
+        hits = list(executor.map(put_keys, [str(tmp_path)] * 4, [keys] * 4))
+    assert hits == [len(keys)] * 4
+    assert sorted(os.listdir(tmp_path)) == [f'{index}.npz' for index in range(5)]
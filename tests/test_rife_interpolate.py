@@ -0,0 +1,17 @@
+# Tests of the helpers of rife_interpolate.py that do not need the weights of the model
+from rife_interpolate import list_frames, split_frames
+
+
+def test_list_frames_leaves_out_generated_frames(tmp_path):
+    for name in ['0000_0000.png', '0000_0001.png', '0000_0003.png', '0001_0000.png', '0002.png', '0010_0010.png', 'notes.txt']:
+        (tmp_path / name).write_bytes(b'')
+    assert list_frames(str(tmp_path)) == ['0000_0000.png', '0001_0000.png', '0002.png']
+
+
+def test_split_frames():
+    filenames = [f'{index:04d}_0000.png' for index in range(10)]
+    shards = split_frames(filenames, 4)
+    assert len(shards) == 4
+    # consecutive shards share their boundary frame, so every pair is in exactly one of them
+    assert [pair for shard in shards for pair in zip(shard, shard[1:])] == list(zip(filenames, filenames[1:]))
+    assert split_frames(filenames[:2], 4) == [filenames[:2]]
@@ -0,0 +1,43 @@
+# Tests of scene_detection.py on synthetic frames: smooth random textures, pans of them and cuts between two of them
+import pytest
+import torch
+import torch.nn.functional as F
+from scene_detection import classify_pair, fill_frames
+
+HEIGHT, WIDTH, MARGIN = 270, 480, 64
+
+
+def get_texture(seed):
+    """
+    Returns a smooth random colour texture larger than a frame, around a random base colour
+    """
+    generator = torch.Generator().manual_seed(seed)
+    noise = torch.rand(1, 3, HEIGHT // 24 + 4, WIDTH // 24 + 4, generator=generator)
+    base = torch.rand(1, 3, 1, 1, generator=generator)
+    noise = F.interpolate(noise, size=(HEIGHT + 2 * MARGIN, WIDTH + 2 * MARGIN), mode='bicubic', align_corners=False)
+    return (0.5 * noise + 0.5 * base).clamp(0, 1)
+
+
+def get_frame(texture, dx=0):
+    return texture[:, :, MARGIN:MARGIN + HEIGHT, MARGIN + dx:MARGIN + dx + WIDTH]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_classify_pair(seed):
+    texture = get_texture(seed)
+    frame = get_frame(texture)
+    assert classify_pair(frame, frame.clone()) == 'duplicate'
+    # pans up to a tenth of the width and fades are not cuts
+    for dx in [2, 8, 24, 48]:
+        assert classify_pair(frame, get_frame(texture, dx)) == 'normal'
+    assert classify_pair(frame, frame * 0.95) == 'normal'
+    # other textures are cuts, even the ones whose grayscale histograms are close to the one of the frame
+    for other in range(100, 104):
+        assert classify_pair(frame, get_frame(get_texture(10 * seed + other))) == 'cut'
+
+
+def test_fill_frames():
+    img0, img1 = torch.zeros(1, 3, 4, 4), torch.ones(1, 3, 4, 4)
+    assert all(frame is img0 for frame in fill_frames(img0, img1, [0.25, 0.5], 'duplicate'))
+    assert all(frame is img0 for frame in fill_frames(img0, img1, [0.25, 0.5], 'cut'))
+    assert [frame.mean().item() for frame in fill_frames(img0, img1, [0.25, 0.5], 'cut', 'crossfade')] == [0.25, 0.5]
@@ -0,0 +1,176 @@
+# Tests of youtube_cache.py with a stub of YoutubeDL that serves the info dict and the captions in tests/fixtures
+import io
+import os
+import json
+import time
+from urllib.parse import urlparse, parse_qs
+import pytest
+from yt_dlp.utils import DownloadError
+import youtube_cache
+import extract_video_frames
+from captions import get_captions
+from youtube_cache import YoutubeCache
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+URL = 'https://www.youtube.com/watch?v=jNQXAC9IVRw'
+
+with open(os.path.join(FIXTURES_PATH, 'info.json'), encoding='utf-8') as f:
+    INFO = json.load(f)
+with open(os.path.join(FIXTURES_PATH, 'captions.en.vtt'), encoding='utf-8') as f:
+    VTT = f.read()
+
+
+def get_generation(url):
+    return int(parse_qs(urlparse(url).query)['generation'][0])
+
+
+class StubYoutubeDL:
+    """
+    Stub of YoutubeDL, every extraction returns the info dict of the fixture with the urls of a new generation,
+    and the urls of the generations in expired fail like the expired urls of YouTube
+    """
+    extractions = 0
+    expired = set()
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def extract_info(self, url, download=False):
+        assert url == URL and not download
+        StubYoutubeDL.extractions += 1
+        info = json.loads(json.dumps(INFO))
+        for item in info['formats'] + [track for tracks in info['automatic_captions'].values() for track in tracks]:
+            item['url'] += f'&generation={StubYoutubeDL.extractions}'
+        return info
+
+    @staticmethod
+    def sanitize_info(info):
+        return info
+
+    def urlopen(self, url):
+        if get_generation(url) in StubYoutubeDL.expired:
+            raise OSError('HTTP Error 403: Forbidden')
+        assert parse_qs(urlparse(url).query)['fmt'] == ['vtt']
+        return io.BytesIO(VTT.encode('utf-8'))
+
+    def process_ie_result(self, info, download=True):
+        format_id = self.params['format'].split('/')[0].split('+')[0]
+        video_format = next(video_format for video_format in info['formats'] if video_format['format_id'] == format_id)
+        if get_generation(video_format['url']) in StubYoutubeDL.expired:
+            raise DownloadError('ERROR: unable to download video data: HTTP Error 403: Forbidden')
+        filepath = self.params['outtmpl'] % {'title': info['title'], 'ext': video_format['ext']}
+        return dict(info, **video_format, requested_downloads=[{'filepath': filepath}])
+
+
+@pytest.fixture(autouse=True)
+def stub_youtube_dl(monkeypatch):
+    StubYoutubeDL.extractions = 0
+    StubYoutubeDL.expired = set()
+    monkeypatch.setattr(youtube_cache, 'YoutubeDL', StubYoutubeDL)
+
+
+def test_get_info_is_extracted_once(tmp_path):
+    cache = YoutubeCache(str(tmp_path))
+    info = cache.get_info(URL)
+    assert cache.get_info(URL) == info
+    assert info['id'] == 'jNQXAC9IVRw'
+    # a new cache on the same path reads the saved entry
+    other = YoutubeCache(str(tmp_path))
+    assert other.get_info(URL) == info
+    assert StubYoutubeDL.extractions == 1
+    assert cache.extractions == 1 and other.extractions == 0
+
+
+def test_get_info_in_memory(tmp_path):
+    cache = YoutubeCache(None)
+    assert cache.get_info(URL) == cache.get_info(URL)
+    assert StubYoutubeDL.extractions == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_info_after_ttl(tmp_path, monkeypatch):
+    cache = YoutubeCache(str(tmp_path), ttl=3600)
+    cache.get_info(URL)
+    cache.get_info(URL)
+    now = time.time()
+    monkeypatch.setattr(youtube_cache.time, 'time', lambda: now + 3601)
+    assert get_generation(cache.get_info(URL)['formats'][1]['url']) == 2
+    assert StubYoutubeDL.extractions == 2
+    # the entries on disk older than ttl are extracted again too
+    other = YoutubeCache(str(tmp_path), ttl=3600)
+    os.utime(other.get_filename(URL, 'info.json'), (now - 3601, now - 3601))
+    monkeypatch.setattr(youtube_cache.time, 'time', lambda: now)
+    assert get_generation(other.get_info(URL)['formats'][1]['url']) == 3
+
+
+def test_invalidate(tmp_path):
+    cache = YoutubeCache(str(tmp_path))
+    cache.get_vtt(URL)
+    other_url = URL + '&t=1'
+    cache.save(other_url, 'info.json', '{}')
+    assert len(os.listdir(tmp_path)) == 3
+    cache.invalidate(URL)
+    assert os.listdir(tmp_path) == [os.path.basename(cache.get_filename(other_url, 'info.json'))]
+    assert list(cache.memory) == [(other_url, 'info.json')]
+    cache.get_info(URL)
+    assert StubYoutubeDL.extractions == 2
+
+
+def test_get_vtt(tmp_path):
+    cache = YoutubeCache(str(tmp_path))
+    assert cache.get_vtt(URL) == VTT
+    assert cache.get_vtt(URL) == VTT
+    assert StubYoutubeDL.extractions == 1
+    with pytest.raises(KeyError):
+        cache.get_vtt(URL, 'de')
+
+
+def test_get_vtt_refreshes_expired_urls(tmp_path):
+    cache = YoutubeCache(str(tmp_path))
+    cache.get_info(URL)
+    StubYoutubeDL.expired = {1}
+    assert cache.get_vtt(URL) == VTT
+    assert StubYoutubeDL.extractions == 2
+    # the urls just extracted are not extracted again when they fail
+    cache.invalidate(URL)
+    StubYoutubeDL.expired = {3}
+    with pytest.raises(OSError):
+        cache.get_vtt(URL)
+    assert StubYoutubeDL.extractions == 3
+
+
+def test_download_refreshes_expired_urls(tmp_path):
+    cache = YoutubeCache(str(tmp_path))
+    cache.get_info(URL)
+    StubYoutubeDL.expired = {1}
+    downloaded = cache.download(URL, {'format': '134', 'outtmpl': 'frames/%(title)s.%(ext)s'})
+    assert downloaded['requested_downloads'][0]['filepath'] == 'frames/Me at the zoo.mp4'
+    assert get_generation(downloaded['url']) == 2
+    assert StubYoutubeDL.extractions == 2
+    StubYoutubeDL.expired = {2, 3}
+    with pytest.raises(DownloadError):
+        cache.download(URL, {'format': '134', 'outtmpl': 'frames/%(title)s.%(ext)s'})
+    assert StubYoutubeDL.extractions == 3
+
+
+def test_captions_and_frames_share_one_extraction(tmp_path, monkeypatch):
+    extracted = []
+    monkeypatch.setattr(extract_video_frames, 'extract_video_frames',
+                        lambda timestamps, filename, frames_path: extracted.append((len(timestamps), filename)))
+    cache = YoutubeCache(str(tmp_path / 'cache'))
+    captions = get_captions(URL, cache)
+    assert [caption['text'] for caption in captions][-1] == "and that's cool and that's pretty much all there is to say"
+    frames_path = str(tmp_path / 'frames')
+    video_format = extract_video_frames.extract_frames_from_yt_video(captions, URL, frames_path, cache, target_resolution=360)
+    # the smallest h264 video only format with 360 lines
+    assert video_format['format_id'] == '134'
+    with open(os.path.join(frames_path, 'video_format.json')) as f:
+        assert json.load(f) == video_format
+    assert extracted == [(len(captions), f'{frames_path}/Me at the zoo.mp4')]
+    assert StubYoutubeDL.extractions == 1 and cache.extractions == 1
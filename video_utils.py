@@ -1,7 +1,47 @@
 # Description: This file contains functions that are used to process videos
 import subprocess
+import numpy as np
 
 def get_video_length(filename):
     #uses ffmpeg to get the length of the video
     video_length = subprocess.check_output(f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {filename}', shell=True, stderr=subprocess.STDOUT)
-    return float(video_length)
\ No newline at end of file
+    return float(video_length)
+
+class FFmpegVideoWriter:
+    """
+    Pipes raw BGR frames into a persistent ffmpeg/libx264 process, the video is encoded while the frames are generated.
+    The size (height, width) of the video is taken from the first frame when not given, bigger frames are cropped to it.
+    """
+    def __init__(self, filename, framerate=30, crf=20, size=None):
+        self.filename = filename
+        self.framerate = framerate
+        self.crf = crf
+        self.process = None
+        self.size = size
+
+    def write(self, image):
+        if self.process is None:
+            # yuv420p needs an even width and height
+            h, w = self.size or image.shape[:2]
+            self.size = (h - h % 2, w - w % 2)
+            command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.size[1]}x{self.size[0]}',
+                       '-framerate', str(self.framerate), '-i', '-',
+                       '-c:v', 'libx264', '-profile:v', 'high', '-crf', str(self.crf), '-pix_fmt', 'yuv420p',
+                       self.filename]
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        h, w = self.size
+        self.process.stdin.write(np.ascontiguousarray(image[:h, :w, :3]).tobytes())
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.process.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
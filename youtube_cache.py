@@ -0,0 +1,151 @@
+# Description: This file contains an on disk cache of the metadata and the captions of YouTube videos
+import os
+import json
+import time
+import hashlib
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+
+# the urls of the formats and the captions in the metadata expire after about 6 hours
+DEFAULT_TTL = 3 * 3600
+
+
+class YoutubeCache:
+    """
+    Cache of the metadata (the info dict of yt-dlp) and the raw VTT captions of YouTube videos by URL.
+    The metadata is extracted once and reused to fetch the captions and to download the video, the entries older than ttl seconds
+    are extracted again, and so is the metadata when its urls have already expired. With cache_path None the entries are only
+    kept in memory while the object lives.
+    """
+    def __init__(self, cache_path='yt_cache', ttl=DEFAULT_TTL):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        # (url, name) -> (time when it was saved, content)
+        self.memory = {}
+        self.extractions = 0
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+
+    def get_filename(self, url, name):
+        return os.path.join(self.cache_path, hashlib.sha256(url.encode()).hexdigest()[:16] + '_' + name)
+
+    def load(self, url, name):
+        """
+        Returns the content saved as name for url, None if it is not cached or it is older than ttl
+        """
+        saved, content = self.memory.get((url, name), (None, None))
+        if content is None and self.cache_path is not None and os.path.exists(self.get_filename(url, name)):
+            saved = os.path.getmtime(self.get_filename(url, name))
+            with open(self.get_filename(url, name), encoding='utf-8') as f:
+                content = f.read()
+            self.memory[(url, name)] = (saved, content)
+        if content is None or time.time() - saved > self.ttl:
+            return None
+        return content
+
+    def save(self, url, name, content):
+        self.memory[(url, name)] = (time.time(), content)
+        if self.cache_path is not None:
+            filename = self.get_filename(url, name)
+            # written to a temporary file first, so a crash never leaves a truncated entry
+            with open(filename + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(filename + '.tmp', filename)
+
+    def invalidate(self, url):
+        """
+        Removes all the entries of url
+        """
+        for key in [key for key in self.memory if key[0] == url]:
+            del self.memory[key]
+        if self.cache_path is not None:
+            prefix = os.path.basename(self.get_filename(url, ''))
+            for filename in os.listdir(self.cache_path):
+                if filename.startswith(prefix):
+                    os.remove(os.path.join(self.cache_path, filename))
+
+    def get_info(self, url, refresh=False):
+        """
+        Returns the info dict of url, extracted again with refresh or when it is not cached.
+
+        Args:
+            url (str): URL of the video.
+            refresh (bool): Ignore the cached metadata.
+
+        Returns:
+            dict: The info dict returned by YoutubeDL.extract_info, sanitized so it can be saved as JSON.
+
+        Raises:
+            yt_dlp.utils.DownloadError: If the metadata can not be extracted.
+        """
+        info = None if refresh else self.load(url, 'info.json')
+        if info is not None:
+            return json.loads(info)
+        with YoutubeDL({'quiet': True, 'skip_download': True}) as ydl:
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        self.extractions += 1
+        self.save(url, 'info.json', json.dumps(info))
+        return info
+
+    def get_vtt(self, url, language='en'):
+        """
+        Returns the automatic captions of url in VTT format, downloaded with the urls of the cached metadata.
+
+        Args:
+            url (str): URL of the video.
+            language (str): Language of the captions.
+
+        Returns:
+            str: The content of the VTT file.
+
+        Raises:
+            KeyError: If the video does not have automatic captions in language.
+            yt_dlp.utils.DownloadError: If the metadata can not be extracted.
+        """
+        name = f'captions.{language}.vtt'
+        vtt = self.load(url, name)
+        if vtt is not None:
+            return vtt
+        for refresh in (False, True):
+            extractions = self.extractions
+            subtitles_list = self.get_info(url, refresh)['automatic_captions'][language]
+            # Now find the vtt subtitles in the list using the extension and a lambda function
+            vtt_subtitles_url = list(filter(lambda x: x['ext'] == 'vtt', subtitles_list))[0]['url']
+            try:
+                with YoutubeDL({'quiet': True}) as ydl:
+                    vtt = ydl.urlopen(vtt_subtitles_url).read().decode('utf-8')
+                break
+            except Exception:
+                # the url of the cached metadata may have expired, the one just extracted has not
+                if refresh or self.extractions > extractions:
+                    raise
+        self.save(url, name, vtt)
+        return vtt
+
+    def download(self, url, ydl_opts):
+        """
+        Downloads url with the cached metadata, like YoutubeDL.download_with_info_file.
+
+        Args:
+            url (str): URL of the video.
+            ydl_opts (dict): Options of YoutubeDL, like format and outtmpl.
+
+        Returns:
+            dict: The info dict of the downloaded video, with the path of the file in requested_downloads.
+
+        Raises:
+            yt_dlp.utils.DownloadError: If the video can not be downloaded.
+        """
+        for refresh in (False, True):
+            extractions = self.extractions
+            info = self.get_info(url, refresh)
+            try:
+                with YoutubeDL(ydl_opts) as ydl:
+                    return ydl.process_ie_result(info, download=True)
+            except DownloadError:
+                # the urls of the formats of the cached metadata may have expired, the ones just extracted have not
+                if refresh or self.extractions > extractions:
+                    raise
+
+    def __str__(self):
+        return f'youtube cache: {self.extractions} extractions, {len(self.memory)} entries'